@@ -1,42 +1,368 @@
 import os
+import re
+import json
+import shutil
+import tempfile
+import uuid
+from urllib.parse import quote
 from groq import Groq
 from dotenv import load_dotenv
 import requests
-import imageio
-from moviepy import ImageSequenceClip
-import numpy as np
+from requests.adapters import HTTPAdapter
 import time
+import random
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED, TimeoutError as FuturesTimeoutError
+from response_cache import ResponseCache, get_shared_cache
+from image_cache import ImageCache, get_shared_image_cache, make_thumbnail
+from label_dataset import parse_labels
+from request_scheduler import get_scheduler, PRIORITY_INTERACTIVE, PRIORITY_BULK
+from telemetry import get_telemetry, current_stage
 
 load_dotenv()
 
+IMAGE_API_URL = os.getenv("POLLINATIONS_URL", "https://image.pollinations.ai")
+# Every render gets its own workspace here; abandoned ones are purged after JOB_RETENTION_SECONDS
+JOBS_DIR = os.path.join(tempfile.gettempdir(), "scriptoria_jobs")
+JOB_RETENTION_SECONDS = 3600
+
+# Production Hub milestones and the upstream plans each one is written against. Script Finalization
+# anchors everything; Budget and Schedule wait for the departments they have to cost and sequence.
+PRODUCTION_DAG = {
+    "Script Finalization": [],
+    "Casting Studio": ["Script Finalization"],
+    "Location Scout": ["Script Finalization"],
+    "Storyboard Preparation": ["Script Finalization"],
+    "Costume & Makeup": ["Script Finalization"],
+    "Crew Selection": ["Script Finalization"],
+    "Budget Planning": ["Script Finalization", "Casting Studio", "Location Scout", "Costume & Makeup", "Crew Selection"],
+    "Schedule Planning": ["Script Finalization", "Casting Studio", "Location Scout", "Storyboard Preparation"]
+}
+# Characters of each upstream plan passed on as context, so fan-in milestones stay within budget
+UPSTREAM_EXCERPT_CHARS = 2500
+
+# Sections of a fused sonic blueprint, in display order (see AIEngine.generate_sound_blueprint)
+BLUEPRINT_SECTIONS = {
+    "ambient_atmosphere": "Ambient Atmosphere",
+    "foley_effects": "Foley Effects",
+    "musical_cues": "Musical Cues",
+    "sound_transitions": "Sound Transitions"
+}
+
+# Model behind each routing tier: long-form writing gets the 70B, extraction and short structured
+# output the fast 8B
+MODEL_TIERS = {
+    "large": "llama-3.3-70b-versatile",
+    "small": "llama-3.1-8b-instant"
+}
+# Per-task model tier, output budget and sampling, keyed by the `task` each method passes to
+# _get_completion; tasks without an entry use "default". Override with AIEngine(routes=...) or a
+# JSON file of the same shape named by SCRIPTORIA_ROUTES (a route may also name a "model" directly).
+TASK_ROUTES = {
+    "default": {"tier": "large", "max_tokens": 2048, "temperature": 0.7},
+    "screenplay": {"tier": "large", "max_tokens": 2048},
+    "screenplay_outline": {"tier": "large", "max_tokens": 3500},
+    "screenplay_scene": {"tier": "large", "max_tokens": 1200},
+    "character_profile": {"tier": "large", "max_tokens": 1500},
+    "production_blueprint": {"tier": "large", "max_tokens": 2048},
+    "face_anchored_script": {"tier": "large", "max_tokens": 600},
+    "sound_design": {"tier": "large", "max_tokens": 1200},
+    "sound_blueprint": {"tier": "large", "max_tokens": 1500},
+    "video_prompt": {"tier": "small", "max_tokens": 400},
+    "video_production_data": {"tier": "small", "max_tokens": 600},
+    "motion_script": {"tier": "small", "max_tokens": 700},
+    "storyboard": {"tier": "small", "max_tokens": 700},
+    "face_identity": {"tier": "small", "max_tokens": 600},
+    # Variations come back as one '|'-separated line and labels as one comma list
+    "video_keyframes": {"tier": "small", "max_tokens": 500, "stop": ["\n\n"]},
+    "ml_labels": {"tier": "small", "max_tokens": 60, "temperature": 0.2, "stop": ["\n"]}
+}
+ROUTES_FILE = os.getenv("SCRIPTORIA_ROUTES")
+
+# Long-form screenplays: scenes drafted at once, and the lines stitching strips from individual scenes
+MAX_SCENE_WORKERS = 10
+_SCENE_HEADING = re.compile(r"^(INT|EXT|EST|INT\./EXT|INT/EXT|I/E)[\.\s]")
+_SCRIPT_BOOKENDS = re.compile(r"^(FADE IN:?|FADE OUT\.?|FADE TO BLACK\.?|THE END\.?)$", re.IGNORECASE)
+_SCENE_ENDINGS = (".", "!", "?", ")", '"', "'", ":", "-", "—", "…")
+
+
+def resolve_routes(overrides=None):
+    """Merges route overrides (task -> partial route) onto TASK_ROUTES and the SCRIPTORIA_ROUTES file.
+
+    Returns {task: {"model", "max_tokens", "temperature", "stop"}} with every field filled in.
+    """
+    merged = {task: dict(route) for task, route in TASK_ROUTES.items()}
+    layers = []
+    if ROUTES_FILE:
+        with open(ROUTES_FILE, encoding="utf-8") as f:
+            layers.append(json.load(f))
+    if overrides:
+        layers.append(overrides)
+    for layer in layers:
+        for task, route in layer.items():
+            merged.setdefault(task, {}).update(route)
+
+    resolved = {}
+    for task, own in merged.items():
+        route = {**merged["default"], **own}
+        if "tier" in own and "model" not in own:
+            route.pop("model", None)  # a task's own tier beats a model pinned on "default"
+        resolved[task] = {
+            "model": route.get("model") or MODEL_TIERS[route["tier"]],
+            "max_tokens": route["max_tokens"],
+            "temperature": route["temperature"],
+            "stop": route.get("stop")
+        }
+    return resolved
+
+class StreamInterrupted(Exception):
+    """Raised by a completion stream that fails after it has already yielded text.
+
+    The partial text is never cached; `partial` holds it for callers that want to show what arrived.
+    """
+
+    def __init__(self, error, partial):
+        super().__init__(error)
+        self.partial = partial
+
+# Set by AIEngine.cache_bypass(); copied into worker threads along with the caller's context
+_cache_bypass = contextvars.ContextVar("cache_bypass", default=False)
+# Scheduling priority for calls made in the current context (see AIEngine.priority)
+_priority = contextvars.ContextVar("priority", default=PRIORITY_INTERACTIVE)
+# Near-duplicate hits of the current AIEngine.semantic_reuse() block; None when reuse is off
+_semantic_hits = contextvars.ContextVar("semantic_hits", default=None)
+
 class AIEngine:
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, cache=None, image_api_url=None, scheduler=None, base_url=None, telemetry=None, image_cache=None, semantic_cache=None, routes=None):
         self.api_key = api_key or os.getenv("GROQ_API_KEY")
         if not self.api_key:
             raise ValueError("Groq API Key not found. Please provide it in the sidebar or .env file.")
-        self.client = Groq(api_key=self.api_key)
+        # Retries are owned by the scheduler so they respect the shared rate-limit budget
+        self.client = Groq(api_key=self.api_key, max_retries=0, base_url=base_url)
+        self.scheduler = scheduler or get_scheduler(self.api_key)
+        # Model, output budget and stop sequences per task (see TASK_ROUTES)
+        self.routes = resolve_routes(routes)
+        # Pass cache=False to always hit the API
+        self.cache = get_shared_cache() if cache is None else (cache or None)
+        # Indexes every call that has a near-duplicate key, whether or not semantic_reuse() is on, so a
+        # result made before reuse was switched on can still be reused; pass semantic_cache=False to
+        # skip indexing entirely. The shared index (and NumPy with it) is only loaded by the first lookup or store
+        self._semantic_cache = semantic_cache
+        # Per-call timings and token usage; pass telemetry=False to switch instrumentation off
+        self.telemetry = get_telemetry() if telemetry is None else (telemetry or None)
+        self.image_api_url = (image_api_url or IMAGE_API_URL).rstrip("/")
+        # Storyboard thumbnails; pass image_cache=False to always fetch
+        self.image_cache = get_shared_image_cache() if image_cache is None else (image_cache or None)
+        # Keep-alive pool shared by every image download this engine makes
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.http.mount("https://", adapter)
+        self.http.mount("http://", adapter)
+
+    @property
+    def semantic_cache(self):
+        """The near-duplicate cache behind semantic_reuse(), or None when it is switched off."""
+        if self._semantic_cache is None:
+            from semantic_cache import get_shared_semantic_cache
+            self._semantic_cache = get_shared_semantic_cache()
+        return self._semantic_cache or None
+
+    @contextmanager
+    def priority(self, level):
+        """Queues every engine call made inside the block at `level` (PRIORITY_INTERACTIVE or PRIORITY_BULK)."""
+        token = _priority.set(level)
+        try:
+            yield
+        finally:
+            _priority.reset(token)
+
+    @contextmanager
+    def cache_bypass(self):
+        """Forces fresh generations for every engine call made inside the block."""
+        token = _cache_bypass.set(True)
+        try:
+            yield
+        finally:
+            _cache_bypass.reset(token)
+
+    @contextmanager
+    def semantic_reuse(self, enabled=True):
+        """Lets engine calls inside the block reuse the result of a near-duplicate earlier prompt.
 
-    def generate_screenplay(self, prompt, context=""):
+        Yields a list that collects a {"task", "similarity", "matched"} dict for every reused result,
+        so the caller can say so and offer to regenerate under cache_bypass(). Only lookups depend on
+        this block; fresh results are indexed either way (see __init__).
+        """
+        hits = []
+        token = _semantic_hits.set(hits if enabled else None)
+        try:
+            yield hits
+        finally:
+            _semantic_hits.reset(token)
+
+    def generate_screenplay(self, prompt, context="", stream=False):
         system_prompt = """You are an expert screenwriter. Generate a screenplay segment based on the user's idea. 
         Use standard Fountain or Screenplay format (SCENE HEADING, ACTION, CHARACTER, DIALOGUE).
         Keep it cinematic and engaging."""
         
         full_prompt = f"Idea: {prompt}\nContext: {context}"
-        return self._get_completion(system_prompt, full_prompt)
+        return self._get_completion(system_prompt, full_prompt, stream=stream, task="screenplay")
+
+    def generate_beat_outline(self, idea, context="", scene_count=12):
+        """Outlines a long-form screenplay as `scene_count` scene beats in one JSON-mode call.
+
+        Returns {"title", "scenes": [{"heading", "summary", "characters"}]}, or an "Error: ..." string.
+        A malformed outline is regenerated once.
+        """
+        system_prompt = f"""You are an expert screenwriter planning a feature-length screenplay. Break the user's idea into exactly
+        {scene_count} scenes that together tell the complete story. Respond with a single JSON object with keys "title" (string)
+        and "scenes": a list of {scene_count} objects, each with "heading" (a screenplay scene heading such as
+        "INT. GARDEN - NIGHT"), "summary" (2-3 sentences: what happens and how the scene ends) and "characters"
+        (list of the names of characters who appear)."""
+        
+        full_prompt = f"Idea: {idea}\nContext: {context}"
+        response_format = {"type": "json_object"}
+        raw = self._get_completion(system_prompt, full_prompt, task="screenplay_outline", response_format=response_format)
+        outline = None if raw.startswith("Error") else self._parse_outline(raw, scene_count)
+        if outline is None and not raw.startswith("Error"):
+            with self.cache_bypass():
+                raw = self._get_completion(system_prompt, full_prompt, task="screenplay_outline", response_format=response_format)
+            outline = None if raw.startswith("Error") else self._parse_outline(raw, scene_count)
+        if outline is None:
+            return raw if raw.startswith("Error") else "Error: the model did not return a usable beat outline."
+        return outline
+
+    @staticmethod
+    def _parse_outline(raw, scene_count):
+        """Validates a beat outline response; returns the outline dict or None."""
+        try:
+            data = json.loads(raw)
+        except json.JSONDecodeError:
+            return None
+        beats = data.get("scenes") if isinstance(data, dict) else None
+        if not isinstance(beats, list):
+            return None
+
+        scenes = []
+        for beat in beats[:scene_count]:
+            if not isinstance(beat, dict):
+                continue
+            heading, summary = beat.get("heading"), beat.get("summary")
+            if not isinstance(heading, str) or not isinstance(summary, str) or not summary.strip():
+                continue
+            characters = beat.get("characters") if isinstance(beat.get("characters"), list) else []
+            scenes.append({
+                "heading": heading.strip().upper(),
+                "summary": summary.strip(),
+                "characters": [c.strip() for c in characters if isinstance(c, str) and c.strip()]
+            })
+        if len(scenes) < max(1, scene_count // 2):
+            return None
+        title = data.get("title") if isinstance(data.get("title"), str) else ""
+        return {"title": title.strip() or "Untitled", "scenes": scenes}
+
+    def generate_outline_scene(self, idea, outline, index, context=""):
+        """Drafts scene `index` of a beat outline, written against its neighbours' summaries."""
+        scenes = outline["scenes"]
+        beat = scenes[index]
+        previous = f"{scenes[index - 1]['heading']}: {scenes[index - 1]['summary']}" if index > 0 else "None, this scene opens the screenplay."
+        following = f"{scenes[index + 1]['heading']}: {scenes[index + 1]['summary']}" if index + 1 < len(scenes) else "None, this scene closes the screenplay."
+        system_prompt = """You are an expert screenwriter drafting one scene of a longer screenplay.
+        Write ONLY the requested scene in standard screenplay format (SCENE HEADING, ACTION, CHARACTER, DIALOGUE), starting with
+        its scene heading. Pick up where the previous scene leaves off and set up the next one, but do not write either of them.
+        No FADE IN/FADE OUT, scene numbers or commentary."""
+        
+        full_prompt = (
+            f"Screenplay: {outline['title']}\nIdea: {idea}\nContext: {context}\n\n"
+            f"Previous scene: {previous}\n"
+            f"THIS SCENE ({index + 1} of {len(scenes)}): {beat['heading']}: {beat['summary']}\n"
+            f"Characters: {', '.join(beat['characters']) or 'as needed'}\n"
+            f"Next scene: {following}"
+        )
+        return self._get_completion(system_prompt, full_prompt, task="screenplay_scene")
+
+    def draft_outline_scenes(self, idea, outline, context="", progress_callback=None, max_workers=MAX_SCENE_WORKERS):
+        """Drafts every scene of a beat outline concurrently and returns {index: scene_text}.
+
+        Each scene only needs the outline, so all of them are in flight at once (within the
+        scheduler's rate limits). `progress_callback(index, scene_text, done, total)` fires on the
+        calling thread as each scene lands; scenes that fail are retried once at the end.
+        """
+        calls = {i: (self.generate_outline_scene, (idea, outline, i, context)) for i in range(len(outline["scenes"]))}
+        scenes = self.run_concurrent(calls, max_workers=max_workers, progress_callback=progress_callback)
+        failed = {i: calls[i] for i, text in scenes.items() if text.startswith("Error")}
+        if failed:
+            def on_retry(index, text, done, total):
+                if progress_callback:
+                    progress_callback(index, text, len(scenes), len(scenes))
+            scenes.update(self.run_concurrent(failed, max_workers=max_workers, progress_callback=on_retry))
+        return scenes
+
+    @staticmethod
+    def stitch_screenplay(outline, scenes):
+        """Joins drafted scenes in outline order and checks them for continuity.
 
-    def generate_character_profile(self, name, description):
+        Returns (screenplay, issues). Per-scene FADE IN/FADE OUT lines are replaced by one pair around
+        the whole script, a missing scene heading is taken from the outline, and the issues list flags
+        failed scenes, headings that drift from the outline, characters the outline never mentions and
+        scenes that look cut off.
+        """
+        beats = outline["scenes"]
+        known = {name.upper() for beat in beats for name in beat["characters"]}
+        known_words = {word for name in known for word in name.split()}
+        issues = []
+        parts = ["FADE IN:"]
+        for i, beat in enumerate(beats):
+            number = i + 1
+            text = scenes.get(i) or "Error: scene was not drafted"
+            if text.startswith("Error"):
+                issues.append(f"Scene {number} failed ({text[7:].strip()}); a placeholder stands in for it.")
+                parts.append(f"{beat['heading']}\n\n[Scene {number} not drafted: {beat['summary']}]")
+                continue
+
+            lines = [line.rstrip() for line in text.strip().replace("```", "").splitlines()]
+            lines = [line for line in lines if not _SCRIPT_BOOKENDS.match(line.strip().strip("*"))]
+            while lines and not lines[0].strip():
+                lines.pop(0)
+            heading = lines[0].strip().strip("*").upper() if lines else ""
+            if not _SCENE_HEADING.match(heading):
+                issues.append(f"Scene {number} had no scene heading; used the outline's \"{beat['heading']}\".")
+                lines.insert(0, beat["heading"])
+            elif heading.split(" - ")[0] != beat["heading"].split(" - ")[0]:
+                issues.append(f"Scene {number} is set at \"{heading}\", but the outline has \"{beat['heading']}\".")
+
+            new_characters = []
+            for line in lines[1:]:
+                cue = re.sub(r"\(.*?\)", "", line.strip().strip("*")).strip()
+                if (cue and cue.isupper() and len(cue) <= 30 and not cue.endswith((".", "!", "?", ":"))
+                        and not _SCENE_HEADING.match(cue) and cue not in known and not set(cue.split()) & known_words
+                        and cue not in new_characters):
+                    new_characters.append(cue)
+            if known and new_characters:
+                issues.append(f"Scene {number} introduces {', '.join(new_characters)}, not in the outline.")
+
+            body = "\n".join(lines).strip()
+            if not body.endswith(_SCENE_ENDINGS):
+                issues.append(f"Scene {number} may be cut off mid-line.")
+            parts.append(body)
+        parts.append("FADE OUT.")
+        return "\n\n".join(parts), issues
+
+    def generate_character_profile(self, name, description, stream=False):
         system_prompt = """You are a master of character development. Create a deep, multidimensional character profile.
         Include: Backstory, Core Motivations, External/Internal Conflicts, and Personality Traits."""
         
         full_prompt = f"Character Name: {name}\nDescription/Archetype: {description}"
-        return self._get_completion(system_prompt, full_prompt)
+        return self._get_completion(system_prompt, full_prompt, stream=stream, task="character_profile",
+                                    semantic=(name.strip().lower(), description))
 
     def generate_sound_design(self, scene_description):
         system_prompt = """You are an award-winning Sound Designer. Create a 'Sonic Blueprint' for the given scene.
         Detail the Ambient Atmosphere, Foley Effects, Musical Cues, and Sound Transitions."""
         
         full_prompt = f"Scene Description: {scene_description}"
-        return self._get_completion(system_prompt, full_prompt)
+        return self._get_completion(system_prompt, full_prompt, task="sound_design", semantic=("", scene_description))
 
     def generate_ml_labels(self, sonic_blueprint):
         """Extracts ML dataset labels (keyword audio events) from a sound design blueprint."""
@@ -46,7 +372,89 @@ class AIEngine:
         Return ONLY the labels as a comma-separated list. No ands, no periods, no introductory text."""
         
         full_prompt = f"Sound Design Blueprint:\n{sonic_blueprint}"
-        return self._get_completion(system_prompt, full_prompt)
+        return self._get_completion(system_prompt, full_prompt, task="ml_labels")
+
+    def generate_sound_blueprint(self, scene_description):
+        """Generates a sonic blueprint and its ML labels in one JSON-mode call.
+
+        Returns (blueprint_markdown, labels). A response that fails validation is regenerated once,
+        then the scene falls back to the two-call generate_sound_design / generate_ml_labels path.
+        On failure the blueprint is the "Error: ..." string and labels is empty.
+        """
+        system_prompt = """You are an award-winning Sound Designer and AI Audio Engineer. Create a 'Sonic Blueprint' for the given scene
+        and tag it for an ML audio dataset. Respond with a single JSON object with exactly these keys:
+        "ambient_atmosphere", "foley_effects", "musical_cues", "sound_transitions" (each a detailed markdown string) and
+        "labels" (a list of 5-7 short, distinct audio event labels such as "Thunder", "Heavy Rain", "Footsteps on Gravel")."""
+        
+        full_prompt = f"Scene Description: {scene_description}"
+        response_format = {"type": "json_object"}
+        raw = self._get_completion(system_prompt, full_prompt, task="sound_blueprint", response_format=response_format,
+                                   semantic=("", scene_description))
+        if raw.startswith("Error"):
+            return raw, []
+        parsed = self._parse_sound_blueprint(raw)
+        if parsed is None:
+            # Overwrites the cached malformed response with a fresh one
+            with self.cache_bypass():
+                raw = self._get_completion(system_prompt, full_prompt, task="sound_blueprint", response_format=response_format,
+                                           semantic=("", scene_description))
+            parsed = None if raw.startswith("Error") else self._parse_sound_blueprint(raw)
+        if parsed is not None:
+            return parsed
+
+        blueprint = self.generate_sound_design(scene_description)
+        if blueprint.startswith("Error"):
+            return blueprint, []
+        labels = self.generate_ml_labels(blueprint)
+        return blueprint, [] if labels.startswith("Error") else parse_labels(labels)
+
+    @staticmethod
+    def _parse_sound_blueprint(raw):
+        """Validates a fused JSON response; returns (blueprint_markdown, labels) or None."""
+        try:
+            data = json.loads(raw)
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(data, dict):
+            return None
+
+        sections = []
+        for key, heading in BLUEPRINT_SECTIONS.items():
+            value = data.get(key)
+            if isinstance(value, list):
+                value = "\n".join(f"- {item}" for item in value if isinstance(item, str) and item.strip())
+            if not isinstance(value, str) or not value.strip():
+                return None
+            sections.append(f"### {heading}\n{value.strip()}")
+
+        labels = parse_labels(data.get("labels"))
+        if len(labels) < 3:
+            return None
+        return "\n\n".join(sections), labels[:7]
+
+    def generate_sound_pack(self, scenes, max_workers=6):
+        """Generates sonic blueprints and ML labels for many scenes concurrently.
+
+        `scenes` is an iterable of (title, scene_description) pairs. Each scene is one fused
+        generate_sound_blueprint call, and results are yielded as (title, blueprint, labels) tuples
+        in completion order, with labels as a list.
+        """
+        def run_scene(title, description):
+            # Packs yield to interactive generations in the scheduler queue
+            with self.priority(PRIORITY_BULK):
+                return (title, *self.generate_sound_blueprint(description))
+
+        pool = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = [
+                pool.submit(contextvars.copy_context().run, run_scene, title, description)
+                for title, description in scenes
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # Drop queued scenes if the consumer stops early
+            pool.shutdown(wait=False, cancel_futures=True)
 
     def generate_video_prompt(self, visual_idea, style="Cinematic"):
         system_prompt = """You are a Visual Effects Supervisor and AI Video Expert. 
@@ -55,14 +463,14 @@ class AIEngine:
         cinematic style, and specific visual details. Ensure it's optimized for tools like Runway Gen-3, Kling, or Luma."""
         
         full_prompt = f"Visual Idea: {visual_idea}\nPreferred Style: {style}"
-        return self._get_completion(system_prompt, full_prompt)
+        return self._get_completion(system_prompt, full_prompt, task="video_prompt")
 
     def get_video_production_data(self, visual_idea):
         system_prompt = """You are a Technical Director. Create a JSON-like technical specification for a 10-second AI video render.
         Include: Frame Rate, Resolution, Motion Bucket, Seed, and Camera Path Coordinates."""
         
         full_prompt = f"Visual Idea: {visual_idea}"
-        return self._get_completion(system_prompt, full_prompt)
+        return self._get_completion(system_prompt, full_prompt, task="video_production_data")
 
     def generate_motion_script(self, visual_idea):
         system_prompt = """You are an AI Animation Director. Create a '10-Second Motion Script'.
@@ -73,7 +481,7 @@ class AIEngine:
         3. Lighting/VFX changes."""
         
         full_prompt = f"Visual Idea: {visual_idea}"
-        return self._get_completion(system_prompt, full_prompt)
+        return self._get_completion(system_prompt, full_prompt, task="motion_script")
 
     def generate_multi_frame_storyboard(self, visual_idea):
         system_prompt = """You are a Storyboard Artist. Break down the user's 10-second video idea into exactly 4 cinematic 'Beats'.
@@ -85,7 +493,7 @@ class AIEngine:
         Return the response in a structured text format that can be easily parsed (Title: Beat 1, Timestamp: 0-2s, Visual: ..., Keywords: ...)."""
         
         full_prompt = f"Video Idea: {visual_idea}"
-        return self._get_completion(system_prompt, full_prompt)
+        return self._get_completion(system_prompt, full_prompt, task="storyboard")
 
     def analyze_face_identity(self, image_desc="Actor Face"):
         system_prompt = """You are a Biometric Identity Architect. Based on the description of an actor's face, generate a 'Visual Identity Profile'.
@@ -93,7 +501,7 @@ class AIEngine:
         Format the output clearly with headers."""
         
         full_prompt = f"Actor Face Description: {image_desc}"
-        return self._get_completion(system_prompt, full_prompt)
+        return self._get_completion(system_prompt, full_prompt, task="face_identity")
 
     def generate_face_anchored_script(self, visual_profile, genre="Neo-Noir"):
         system_prompt = f"""You are a Screenwriter who writes specifically for actors' unique visual types. 
@@ -102,66 +510,191 @@ class AIEngine:
         Genre: {genre}"""
         
         full_prompt = f"Visual Identity Profile:\n{visual_profile}"
-        return self._get_completion(system_prompt, full_prompt)
+        return self._get_completion(system_prompt, full_prompt, task="face_anchored_script")
+
+    def generate_ai_video(self, prompt, status_callback=None, frame_deadline=60, width=1920, height=1080, fps=24, duration=10, soundtrack=None):
+        """Generates a cinematic video from 5 Pollinations.ai keyframes with synthesized pan/zoom motion.
+
+        Pass `soundtrack` (a list of sound labels) to mux a procedural audio bed into the MP4.
+        Returns (output_path, error). The MP4 lives in a per-job workspace; call cleanup_job(output_path)
+        once it has been served, otherwise it is purged automatically after JOB_RETENTION_SECONDS.
+        """
+        # The video stack is only needed here, so it is imported on first render rather than at startup
+        import imageio
+        import imageio.v3 as iio
+        from motion_synthesis import render_motion
 
-    def generate_ai_video(self, prompt, status_callback=None):
-        """Generates a 5-second cinematic video using Pollinations.ai and MoviePy."""
         # 1. Generate 5 variations for keyframes to simulate motion
-        system_prompt = """Generate 5 unique cinematic descriptions for a 5-second sequence based on the user's prompt. 
+        system_prompt = f"""Generate 5 unique cinematic descriptions for a {duration}-second sequence based on the user's prompt. 
         Each should describe a slight variation in camera, lighting, or action to simulate motion. 
         Return ONLY the list of 5 descriptions separated by '|'. No other text."""
         
-        variations_raw = self._get_completion(system_prompt, prompt)
+        variations_raw = self._get_completion(system_prompt, prompt, task="video_keyframes")
         variations = [v.strip() for v in variations_raw.split('|') if v.strip()][:5]
         
         if len(variations) < 5:
             variations = [prompt] * 5
             
-        # 2. Download Images
-        frames_dir = "v_temp_frames"
-        os.makedirs(frames_dir, exist_ok=True)
-        frame_paths = []
+        # 2. Download Images (concurrently, keeping whatever arrives before the deadline)
+        if status_callback:
+            status_callback(f"Synthesizing {len(variations)} Frames in parallel...")
         
+        urls = []
         for i, val in enumerate(variations):
-            if status_callback:
-                status_callback(f"Synthesizing Frame {i+1}/5: {val[:50]}...")
-            
             clean_val = "".join([c if c.isalnum() or c == " " else "" for c in val]).replace(" ", "%20")
-            url = f"https://image.pollinations.ai/prompt/{clean_val}?width=1024&height=576&nologo=true&seed={int(time.time())+i}"
-            
+            urls.append(f"{self.image_api_url}/prompt/{clean_val}?width=1024&height=576&nologo=true&seed={int(time.time())+i}")
+        
+        def on_frame(i, done, total):
+            if status_callback:
+                status_callback(f"Synthesized Frame {done}/{total}: {variations[i][:50]}...")
+        
+        frames = self._download_frames(urls, time.monotonic() + frame_deadline, progress_callback=on_frame)
+        
+        # Decode straight from the downloaded bytes; nothing touches disk before the encoder
+        keyframes = []
+        for i in sorted(frames):
             try:
-                response = requests.get(url, timeout=30)
-                if response.status_code == 200:
-                    path = os.path.join(frames_dir, f"frame_{i}.jpg")
-                    with open(path, "wb") as f:
-                        f.write(response.content)
-                    frame_paths.append(path)
+                keyframes.append(self._fit_frame(iio.imread(frames[i]), 576, 1024))
             except Exception as e:
-                print(f"Error downloading frame {i}: {e}")
+                print(f"Error decoding frame {i}: {e}")
                 
-        if not frame_paths:
+        if not keyframes:
             return None, "Failed to generate visual frames."
             
         # 3. Stitch into Video
+        self.purge_stale_jobs()
+        # Outside the try below: an exception from the callback (e.g. a cancelled job) must propagate,
+        # not be reported as an encoder failure
+        if status_callback:
+            status_callback(f"Finalizing Cinematic Render ({duration}s @ {fps} fps, {width}x{height})...")
+        job_dir = os.path.join(JOBS_DIR, uuid.uuid4().hex)
+        os.makedirs(job_dir)
+        output_path = os.path.join(job_dir, "generated_video.mp4")
         try:
-            if status_callback:
-                status_callback("Finalizing Cinematic Render (Stitching 5s Sequence)...")
-            
-            # Create a 5-second clip (1 FPS to ensure it lasts 5 seconds with 5 frames)
-            clip = ImageSequenceClip(frame_paths, fps=1)
-            output_path = "generated_video.mp4"
-            clip.write_videofile(output_path, codec="libx264", audio=False, verbose=False, logger=None)
-            
-            # Simple cleanup
-            for p in frame_paths:
-                try: os.remove(p)
-                except: pass
+            audio = {}
+            if soundtrack:
+                from audio_engine import AudioPreviewEngine
+                audio_path = os.path.join(job_dir, "soundtrack.wav")
+                AudioPreviewEngine(seconds=duration).write_wav(audio_path, soundtrack)
+                audio = {"audio_path": audio_path, "audio_codec": "aac"}
+
+            # Motion frames are synthesized in bounded chunks and piped to ffmpeg's stdin
+            with imageio.get_writer(output_path, fps=fps, codec="libx264", macro_block_size=8,
+                                    ffmpeg_params=["-preset", "ultrafast"], **audio) as writer:
+                for batch in render_motion(keyframes, width, height, fps, duration):
+                    for frame in batch:
+                        writer.append_data(frame)
             
             return output_path, None
         except Exception as e:
+            shutil.rmtree(job_dir, ignore_errors=True)
             return None, f"Video Stitching Error: {str(e)}"
 
-    def generate_production_blueprint(self, project_idea, category):
+    def fetch_storyboard_images(self, keywords, width=400, height=300, deadline=30):
+        """Returns a JPEG thumbnail (bytes, or None if it could not be fetched) for each storyboard beat.
+
+        Beat i is rendered from `keywords[i]` with seed i. Cached thumbnails are served from disk;
+        the rest are downloaded concurrently, resized to width x height and cached.
+        """
+        prompts = [f"{kw},film,cinematic" for kw in keywords]
+        keys = [ImageCache.make_key(prompt, width, height, seed) for seed, prompt in enumerate(prompts)]
+        images = [self.image_cache.get(key) if self.image_cache else None for key in keys]
+
+        missing = [i for i, image in enumerate(images) if image is None]
+        urls = [f"{self.image_api_url}/prompt/{quote(prompts[i])}?width={width}&height={height}&nologo=true&seed={i}" for i in missing]
+        downloads = self._download_frames(urls, time.monotonic() + deadline) if urls else {}
+        for j, content in downloads.items():
+            i = missing[j]
+            try:
+                images[i] = make_thumbnail(content, width, height)
+            except Exception as e:
+                print(f"Error decoding storyboard image {i}: {e}")
+                continue
+            if self.image_cache:
+                self.image_cache.set(keys[i], images[i])
+        return images
+
+    @staticmethod
+    def _fit_frame(frame, height, width):
+        """Center-crops or black-pads a decoded RGB frame to exactly height x width."""
+        import numpy as np
+
+        if frame.ndim == 2:
+            frame = np.stack([frame] * 3, axis=-1)
+        frame = frame[..., :3]
+        top = max(0, (frame.shape[0] - height) // 2)
+        left = max(0, (frame.shape[1] - width) // 2)
+        frame = frame[top:top + height, left:left + width]
+        if frame.shape[:2] == (height, width):
+            return frame
+        canvas = np.zeros((height, width, 3), dtype=np.uint8)
+        y, x = (height - frame.shape[0]) // 2, (width - frame.shape[1]) // 2
+        canvas[y:y + frame.shape[0], x:x + frame.shape[1]] = frame
+        return canvas
+
+    @staticmethod
+    def cleanup_job(output_path):
+        """Removes the job workspace that holds a rendered video."""
+        job_dir = os.path.dirname(os.path.abspath(output_path))
+        if os.path.dirname(job_dir) == os.path.abspath(JOBS_DIR):
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+    @staticmethod
+    def purge_stale_jobs(max_age=JOB_RETENTION_SECONDS):
+        """Deletes job workspaces left behind by renders older than `max_age` seconds."""
+        if not os.path.isdir(JOBS_DIR):
+            return
+        cutoff = time.time() - max_age
+        for entry in os.scandir(JOBS_DIR):
+            try:
+                if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            except OSError:
+                pass
+
+    def _download_frames(self, urls, deadline, retries=2, progress_callback=None):
+        """Downloads image URLs concurrently over the pooled session.
+
+        Each frame is retried with jittered exponential backoff. Returns {index: bytes} for every
+        frame that finished before `deadline` (a time.monotonic() value); late frames are dropped.
+        """
+        def fetch(i, url):
+            backoff = 1.0
+            for attempt in range(retries + 1):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    response = self.http.get(url, timeout=min(30, remaining))
+                    if response.status_code == 200:
+                        return response.content
+                    # Client errors other than throttling will not improve on retry
+                    if response.status_code < 500 and response.status_code != 429:
+                        break
+                except requests.RequestException as e:
+                    print(f"Error downloading frame {i} (attempt {attempt + 1}): {e}")
+                time.sleep(min(backoff * random.uniform(0.5, 1.5), max(0, deadline - time.monotonic())))
+                backoff *= 2
+            return None
+
+        frames = {}
+        pool = ThreadPoolExecutor(max_workers=len(urls) or 1)
+        try:
+            futures = {pool.submit(fetch, i, url): i for i, url in enumerate(urls)}
+            for future in as_completed(futures, timeout=max(0, deadline - time.monotonic())):
+                content = future.result()
+                if content:
+                    i = futures[future]
+                    frames[i] = content
+                    if progress_callback:
+                        progress_callback(i, len(frames), len(urls))
+        except FuturesTimeoutError:
+            print(f"Frame deadline reached with {len(frames)}/{len(urls)} frames; using partial results.")
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+        return frames
+
+    def generate_production_blueprint(self, project_idea, category, stream=False, context=""):
         """Generates specific pre-production plans based on category."""
         prompts = {
             "Script Finalization": "You are a Script Doctor and Editor. Review and finalize the given scene/concept. Focus on pacing, dialogue rhythm, and emotional impact. Provide a polished 'Final Draft' version.",
@@ -176,21 +709,235 @@ class AIEngine:
         
         system_prompt = prompts.get(category, "You are a Film Production Expert. Provide detailed planning for the given project.")
         full_prompt = f"Project Concept/Scene: {project_idea}\nCategory: {category}"
-        return self._get_completion(system_prompt, full_prompt)
+        if context:
+            full_prompt += f"\n\nApproved Upstream Plans (stay consistent with these):\n{context}"
+        # Upstream plans must match exactly; only the project idea itself is compared for near-duplicates
+        return self._get_completion(system_prompt, full_prompt, stream=stream, task="production_blueprint",
+                                    semantic=(f"{category}\n{context}", project_idea))
+
+    def architect_all_milestones(self, project_idea, progress_callback=None):
+        """Generates every Production Hub milestone, running them as the PRODUCTION_DAG dependency graph.
 
-    def _get_completion(self, system_message, user_message):
+        Each milestone sees excerpts of its upstream plans. Returns {category: blueprint} and calls
+        `progress_callback(category, blueprint, done, total)` on the calling thread as each one lands.
+        """
+        def milestone(category):
+            def run(upstream):
+                context = self.milestone_context(category, upstream)
+                return self.generate_production_blueprint(project_idea, category, context=context)
+            return run
+
+        nodes = {category: (deps, milestone(category)) for category, deps in PRODUCTION_DAG.items()}
+        return self.run_dag(nodes, progress_callback=progress_callback)
+
+    def run_concurrent(self, calls, max_workers=None, progress_callback=None):
+        """Runs independent engine calls in parallel and returns their results keyed like `calls`.
+
+        `calls` maps a key to a (callable, args) pair. `progress_callback(key, result, done, total)`
+        fires on the calling thread as each call finishes, so it can safely update Streamlit widgets.
+        """
+        results = {}
+        if not calls:
+            return results
+
+        with ThreadPoolExecutor(max_workers=max_workers or len(calls)) as pool:
+            futures = {
+                pool.submit(contextvars.copy_context().run, fn, *args): key
+                for key, (fn, args) in calls.items()
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                key = futures[future]
+                try:
+                    results[key] = future.result()
+                except Exception as e:
+                    results[key] = f"Error: {str(e)}"
+                if progress_callback:
+                    progress_callback(key, results[key], done, len(calls))
+        return results
+
+    @staticmethod
+    def milestone_context(category, plans):
+        """Formats excerpts of the finished plans that `category` depends on in PRODUCTION_DAG."""
+        return "\n\n".join(
+            f"### {dep}\n{plans[dep][:UPSTREAM_EXCERPT_CHARS]}"
+            for dep in PRODUCTION_DAG.get(category, [])
+            if dep in plans and not plans[dep].startswith("Error")
+        )
+
+    def run_dag(self, nodes, max_workers=None, progress_callback=None):
+        """Runs engine calls as a dependency graph, starting each node as soon as its inputs are ready.
+
+        `nodes` maps a key to (dependency_keys, fn); `fn` receives {dependency_key: result}. Failed
+        dependencies still unblock their dependents. Returns {key: result} and reports completions
+        like run_concurrent.
+        """
+        results = {}
+        remaining = dict(nodes)
+        running = {}
+        pool = ThreadPoolExecutor(max_workers=max_workers or len(nodes) or 1)
         try:
-            completion = self.client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": user_message}
-                ],
-                temperature=0.7,
-                max_tokens=2048,
-                top_p=1,
-                stream=False,
+            while remaining or running:
+                for key, (deps, fn) in list(remaining.items()):
+                    if all(dep in results for dep in deps):
+                        upstream = {dep: results[dep] for dep in deps}
+                        running[pool.submit(contextvars.copy_context().run, fn, upstream)] = key
+                        del remaining[key]
+                if not running:
+                    raise ValueError(f"Unsatisfiable dependencies for: {', '.join(remaining)}")
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    key = running.pop(future)
+                    try:
+                        results[key] = future.result()
+                    except Exception as e:
+                        results[key] = f"Error: {str(e)}"
+                    if progress_callback:
+                        progress_callback(key, results[key], len(results), len(nodes))
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+        return results
+
+    def _get_completion(self, system_message, user_message, use_cache=True, stream=False, task="completion", response_format=None, semantic=None):
+        """Returns the completion text, or an iterator of text chunks when `stream` is set.
+
+        `task` names the calling method in telemetry; `response_format` is passed through to the API
+        (e.g. {"type": "json_object"}) and is part of the cache key. `semantic` is an (exact, fuzzy)
+        pair of prompt inputs: inside semantic_reuse(), an earlier call whose `exact` input matches and
+        whose `fuzzy` one is a near-duplicate is answered from the semantic cache.
+        """
+        route = self.routes.get(task, self.routes["default"])
+        request = {
+            "model": route["model"],
+            "messages": [
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": user_message}
+            ],
+            "temperature": route["temperature"],
+            "max_tokens": route["max_tokens"],
+            "top_p": 1,
+        }
+        if route["stop"]:
+            request["stop"] = route["stop"]
+        if response_format:
+            request["response_format"] = response_format
+        # Captured now: a streaming generator's body runs later, outside the caller's context blocks
+        call = {"task": task, "stage": current_stage(), "model": request["model"], "max_tokens": request["max_tokens"],
+                "stream": stream, "priority": _priority.get(), "started": time.perf_counter()}
+        cache_key = None
+        if self.cache and use_cache:
+            cache_key = ResponseCache.make_key(request)
+            if not _cache_bypass.get():
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    self._record(call, "cache_hit", ttft=time.perf_counter() - call["started"], cached=True)
+                    return iter([cached]) if stream else cached
+
+        semantic_key = None
+        # Tasks without a similarity threshold are never looked up or stored by the cache itself
+        if semantic and self._semantic_cache is not False:
+            exact, fuzzy = semantic
+            scope = ResponseCache.make_key([request["model"], system_message, response_format, exact])
+            semantic_key = (task, scope, fuzzy)
+            hits = _semantic_hits.get()
+            if hits is not None and not _cache_bypass.get():
+                match = self.semantic_cache.lookup(*semantic_key)
+                if match is not None:
+                    value, similarity, matched = match
+                    hits.append({"task": task, "similarity": similarity, "matched": matched})
+                    self._record(call, "semantic_hit", ttft=time.perf_counter() - call["started"], cached=True)
+                    return iter([value]) if stream else value
+
+        estimated_tokens = (len(system_message) + len(user_message)) // 4 + request["max_tokens"]
+        if stream:
+            return self._stream_completion(request, cache_key, semantic_key, estimated_tokens, call)
+
+        queue_wait = 0.0
+        try:
+            completion, queue_wait = self.scheduler.submit(
+                lambda: self.client.chat.completions.create(**request, stream=False),
+                estimated_tokens, call["priority"]
             )
-            return completion.choices[0].message.content
+            content = completion.choices[0].message.content
         except Exception as e:
+            self._record(call, "error", queue_wait=queue_wait, error=str(e))
             return f"Error: {str(e)}"
+        if completion.usage:
+            self.scheduler.record_usage(estimated_tokens, completion.usage.total_tokens)
+        # The whole text arrives at once, so the first token lands when the call returns
+        self._record(call, "ok", queue_wait=queue_wait, ttft=time.perf_counter() - call["started"], usage=completion.usage)
+
+        self._store(cache_key, semantic_key, content)
+        return content
+
+    def _store(self, cache_key, semantic_key, content):
+        """Saves a fresh completion to the exact-match and semantic caches (the latter even with reuse off)."""
+        if cache_key:
+            self.cache.set(cache_key, content)
+        if semantic_key:
+            self.semantic_cache.add(*semantic_key, content)
+
+    def _stream_completion(self, request, cache_key, semantic_key, estimated_tokens, call):
+        """Yields completion chunks as Groq produces them and caches the full text once it finishes.
+
+        A failure before the first chunk yields a single "Error: ..." chunk, like the non-streaming
+        path; a failure after it raises StreamInterrupted, so a cut-off text cannot pass for a whole one.
+        """
+        parts = []
+        usage = None
+        queue_wait = 0.0
+        ttft = None
+        outcome, error = "cancelled", None
+        try:
+            # Only opening the stream is scheduled (and retried); a throttled request fails before any chunk
+            stream, queue_wait = self.scheduler.submit(
+                lambda: self.client.chat.completions.create(**request, stream=True),
+                estimated_tokens, call["priority"]
+            )
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    if ttft is None:
+                        ttft = time.perf_counter() - call["started"]
+                    parts.append(delta)
+                    yield delta
+                x_groq = getattr(chunk, "x_groq", None)
+                if x_groq is not None and getattr(x_groq, "usage", None):
+                    usage = x_groq.usage
+            outcome = "ok"
+        except Exception as e:
+            outcome, error = "error", str(e)
+            if parts:
+                raise StreamInterrupted(f"Error: {str(e)}", "".join(parts)) from e
+            yield f"Error: {str(e)}"
+            return
+        finally:
+            # Also reached when the consumer abandons the stream (outcome stays "cancelled")
+            self._record(call, outcome, queue_wait=queue_wait, ttft=ttft, usage=usage, error=error)
+        
+        self.scheduler.record_usage(estimated_tokens, usage.total_tokens if usage else estimated_tokens)
+
+        self._store(cache_key, semantic_key, "".join(parts))
+
+    def _record(self, call, outcome, queue_wait=0.0, ttft=None, usage=None, cached=False, error=None):
+        """Emits one telemetry event for a finished (or abandoned) completion call."""
+        if not self.telemetry:
+            return
+        wall = time.perf_counter() - call["started"]
+        self.telemetry.emit({
+            "ts": time.time(),
+            "task": call["task"],
+            "stage": call["stage"],
+            "model": call["model"],
+            "max_tokens": call["max_tokens"],
+            "stream": call["stream"],
+            "priority": call["priority"],
+            "outcome": outcome,
+            "cached": cached,
+            "wall_s": round(wall, 4),
+            "queue_wait_s": round(queue_wait, 4),
+            "ttft_s": round(ttft, 4) if ttft is not None else None,
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+            "error": error
+        })
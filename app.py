@@ -1,7 +1,21 @@
 import streamlit as st
-from ai_engine import AIEngine
+from ai_engine import AIEngine, PRODUCTION_DAG, StreamInterrupted
+from request_scheduler import get_scheduler
+from telemetry import set_stage, percentile, METRICS_PORT
+from context_builder import make_digest, pack_character_context, count_tokens, DEFAULT_CONTEXT_BUDGET
+from project_store import ProjectStore, MasterBook
+from pdf_export import PdfBookRenderer
+from jobs import JobQueue, ACTIVE_STATUSES, quota_limits
+from label_dataset import LabelDataset
+from contextlib import contextmanager
+import io
 import os
 import re
+import time
+
+# Archive entries per page, and characters per page of long generated output
+ARCHIVE_PAGE_SIZE = 10
+OUTPUT_PAGE_CHARS = 6000
 
 # Page configuration
 st.set_page_config(
@@ -26,13 +40,52 @@ st.sidebar.markdown("---")
 api_key = st.sidebar.text_input("Groq API Key", type="password", value="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")
 st.sidebar.info("API Key is pre-filled from your request.")
 
+@st.cache_resource(show_spinner=False)
+def get_project_store():
+    """One SQLite-backed project store shared by every session."""
+    return ProjectStore()
+
+@st.cache_resource(show_spinner=False)
+def get_job_queue():
+    """One background job queue (and worker process pool) shared by every session."""
+    return JobQueue()
+
+@st.cache_resource(show_spinner=False)
+def get_label_dataset():
+    """The ML label dataset every Sonic result is added to, shared by all sessions."""
+    return LabelDataset()
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def audio_preview(labels):
+    """A 10-second procedural WAV preview of a tuple of sound labels, mixed locally."""
+    # NumPy and the synthesis tables are only loaded once a preview is actually shown
+    from audio_engine import get_shared_preview_engine
+    return get_shared_preview_engine().render_wav(labels)
+
+def load_project(name):
+    """Points the session's artifacts at a stored project; contents load lazily as they are read."""
+    store = get_project_store()
+    project_id = store.project_id(name)
+    st.session_state.project_name = name
+    st.session_state.characters = store.artifacts(project_id, "character")
+    st.session_state.character_digests = {}
+    st.session_state.scripts = store.artifacts(project_id, "script")
+    st.session_state.production_data = store.artifacts(project_id, "production_plan")
+    st.session_state.master_book = MasterBook(st.session_state.production_data)
+    # Cached PDF pages belong to the previous project
+    st.session_state.pdf_renderer = PdfBookRenderer()
+
+# Project Selection (characters, scripts and plans persist per project across refreshes)
+project_names = get_project_store().projects() or ["Untitled Project"]
+project_choice = st.sidebar.selectbox("Project", project_names + ["➕ New Project"])
+if project_choice == "➕ New Project":
+    project_choice = st.sidebar.text_input("New Project Name").strip() or None
+
 # Initialize Session State
-if "characters" not in st.session_state:
-    st.session_state.characters = {}
-if "scripts" not in st.session_state:
-    st.session_state.scripts = []
-if "production_data" not in st.session_state:
-    st.session_state.production_data = {}
+if project_choice and st.session_state.get("project_name") != project_choice:
+    load_project(project_choice)
+elif "project_name" not in st.session_state:
+    load_project(project_names[0])
 if "production_progress" not in st.session_state:
     st.session_state.production_progress = 0
 
@@ -73,9 +126,11 @@ themes = {
     }
 }
 
-current_theme = themes.get(menu, themes["About"])
-
-st.markdown(f"""
+@st.cache_data(show_spinner=False)
+def theme_css(theme_name):
+    """Builds the page stylesheet once per theme instead of on every rerun."""
+    current_theme = themes.get(theme_name, themes["About"])
+    return f"""
 <style>
     .stApp {{
         background: linear-gradient({current_theme["overlay"]}, {current_theme["overlay"]}), 
@@ -133,17 +188,181 @@ st.markdown(f"""
         border-radius: 10px !important;
     }}
 </style>
-""", unsafe_allow_html=True)
+"""
+
+st.markdown(theme_css(menu), unsafe_allow_html=True)
 
 # AI Engine Initialization
+@st.cache_resource(show_spinner=False)
+def get_engine(api_key):
+    """Builds one engine (and its Groq/HTTP connection pools) per API key, shared across reruns and sessions.
+
+    The app and background job workers draw on one shared quota per key (see jobs.quota_limits).
+    """
+    return AIEngine(api_key=api_key, scheduler=get_scheduler(api_key, **quota_limits()))
 
 # Initialize AI Engine
 try:
-    ai = AIEngine(api_key=api_key)
+    ai = get_engine(api_key)
 except Exception as e:
     st.error(f"Initialization Error: {e}")
     st.stop()
 
+if ai.cache:
+    cache_stats = ai.cache.stats()
+    st.sidebar.caption(f"⚡ Response cache: {cache_stats['memory_hits'] + cache_stats['disk_hits']} hits / {cache_stats['misses']} misses ({cache_stats['disk_items']} stored)")
+
+# Opt-in: a lightly edited idea can reuse the earlier result instead of paying for a full generation
+reuse_similar = st.sidebar.toggle("♻️ Reuse near-duplicate results", value=False, help="Character profiles, sonic plans and milestone blueprints for a near-identical request are returned instantly, with an option to regenerate.")
+
+# Filled in after the page has run so it includes this run's calls
+perf_panel = st.sidebar.expander("📈 Performance", key="perf_panel", on_change="rerun")
+
+# Attribute every engine call made during this run to the selected workflow stage
+set_stage(menu)
+
+def render_stream(chunks, refresh_interval=0.05):
+    """Renders streamed completion chunks into an output pane as they arrive and returns the full text.
+
+    A stream that breaks off midway returns its "Error: ..." message instead of the partial text, so
+    callers never save or offer a truncated result.
+    """
+    pane = st.empty()
+    text = ""
+    last_render = 0.0
+    try:
+        for chunk in chunks:
+            text += chunk
+            # Throttle redraws so long generations don't flood the browser with deltas
+            if time.monotonic() - last_render >= refresh_interval:
+                pane.markdown(f'<div class="output-container">{text}▌</div>', unsafe_allow_html=True)
+                last_render = time.monotonic()
+    except StreamInterrupted as e:
+        text = f"{e} (the response was cut off after {len(e.partial)} characters)"
+    if text.startswith("Error"):
+        pane.empty()
+    else:
+        pane.markdown(f'<div class="output-container">{text}</div>', unsafe_allow_html=True)
+    return text
+
+def request_regenerate(task):
+    st.session_state.regenerate = task
+
+@contextmanager
+def generation_scope(regenerate):
+    """Wraps one generation: a forced fresh call after "Regenerate", otherwise near-duplicate reuse if enabled.
+
+    Yields the list of reused results (empty when the generation was fresh).
+    """
+    if regenerate:
+        with ai.cache_bypass():
+            yield []
+    else:
+        with ai.semantic_reuse(reuse_similar) as reused:
+            yield reused
+
+def offer_regenerate(reused, task):
+    """Says when an earlier near-duplicate result was reused and offers a fresh generation instead."""
+    if reused:
+        hit = reused[0]
+        st.info(f"♻️ Reused the result of a near-identical earlier request ({hit['similarity']:.0%} similar): \"{hit['matched'][:100]}\"")
+        st.button("🔄 Regenerate", key=f"regen_{task}", on_click=request_regenerate, args=(task,))
+
+def paginate_text(text, page_chars=OUTPUT_PAGE_CHARS):
+    """Splits long output into pages on paragraph boundaries."""
+    pages, current = [], ""
+    for paragraph in text.split("\n\n"):
+        # A single oversized paragraph is cut at the last space before the page limit
+        while len(paragraph) > page_chars:
+            cut = paragraph.rfind(" ", 0, page_chars) + 1 or page_chars
+            if current:
+                pages.append(current)
+                current = ""
+            pages.append(paragraph[:cut])
+            paragraph = paragraph[cut:]
+        if current and len(current) + len(paragraph) > page_chars:
+            pages.append(current)
+            current = ""
+        current += paragraph + "\n\n"
+    pages.append(current)
+    return pages
+
+def render_paginated(text, key):
+    """Renders output in a pane, one page at a time when it is long."""
+    pages = paginate_text(text)
+    page = 1
+    if len(pages) > 1:
+        page = st.number_input(f"Page (of {len(pages)})", min_value=1, max_value=len(pages), value=1, key=f"page_{key}")
+    st.markdown(f'<div class="output-container">{pages[page - 1]}</div>', unsafe_allow_html=True)
+
+@st.fragment(run_every=1.0)
+def watch_job(param):
+    """Polls a background job's progress; reruns the whole page once the job has finished."""
+    job = get_job_queue().get(st.query_params.get(param))
+    if job is None or job["status"] not in ACTIVE_STATUSES:
+        st.rerun()
+    st.progress(job["progress"], text=job["message"] or "")
+    st.caption(f"Job `{job['id'][:8]}` is {job['status']}. It keeps running if you leave; reopen this page's URL to reattach.")
+    if st.button("Cancel Job", key=f"cancel_{param}"):
+        get_job_queue().cancel(job["id"])
+
+def release_clip_render():
+    """Deletes the rendered video of the Clip Studio job in the URL once it is dismissed or replaced."""
+    job = get_job_queue().get(st.query_params.get("clip_job"))
+    if job and job["result"] and job["result"].get("video_path"):
+        AIEngine.cleanup_job(job["result"]["video_path"])
+
+def show_job(param, render_result, on_dismiss=None):
+    """Shows the background job whose id is in query parameter `param`: its progress, or its result."""
+    job = get_job_queue().get(st.query_params[param])
+    if job is None:
+        st.warning("That job no longer exists.")
+        del st.query_params[param]
+        return
+    if job["status"] in ACTIVE_STATUSES:
+        watch_job(param)
+        return
+    if job["status"] == "done":
+        render_result(job["params"], job["result"])
+    elif job["status"] == "cancelled":
+        st.info("Job cancelled.")
+    else:
+        st.error(f"Job failed: {job['error']}")
+    if st.button("Dismiss", key=f"dismiss_{param}"):
+        if on_dismiss:
+            on_dismiss()
+        del st.query_params[param]
+        st.rerun()
+
+@st.fragment
+def render_archive():
+    """Project Archive; paging and opening entries rerun only this fragment, not the whole page."""
+    archive_kinds = {
+        "Milestone Plans": st.session_state.production_data,
+        "Screenplays": st.session_state.scripts,
+        "Characters": st.session_state.characters
+    }
+    kind = st.radio("Archive", list(archive_kinds), horizontal=True, label_visibility="collapsed", key="archive_kind")
+    artifacts = archive_kinds[kind]
+    if not artifacts:
+        st.info("Nothing archived here yet. Architect your first milestone to see the archive.")
+        return
+    
+    # Natural sort keeps order consistent and puts "Scene 2" before "Scene 10"
+    names = sorted(artifacts, key=lambda name: [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", name)])
+    page_count = -(-len(names) // ARCHIVE_PAGE_SIZE)
+    page = 1
+    if page_count > 1:
+        page = st.number_input(f"Archive page (of {page_count})", min_value=1, max_value=page_count, value=1, key=f"archive_page_{kind}")
+    for name in names[(page - 1) * ARCHIVE_PAGE_SIZE:page * ARCHIVE_PAGE_SIZE]:
+        entry = st.expander(f"📄 {name} (v{artifacts.version(name)})", key=f"archive_{kind}_{name}", on_change="rerun")
+        # Bodies load from the project store and render only while their entry is open
+        if entry.open:
+            with entry:
+                data = artifacts[name]
+                render_paginated(data, f"{kind}_{name}")
+                st.download_button(f"Download {name}", data, file_name=f"{name.lower().replace(' ', '_')}.txt", key=f"dl_{kind}_{name}")
+
 # Main Header
 st.title(f"🚀 {menu}")
 
@@ -159,22 +378,64 @@ if menu == "Screenplay Generator":
             st.info("💡 Link your developed characters to this scene:")
             selected_chars = st.multiselect("Select Characters", options=list(st.session_state.characters.keys()))
         
+        # Linked characters are packed from their digests into a fixed token budget, not pasted in full
         char_context = ""
-        for char in selected_chars:
-            char_context += f"\nCharacter Profile ({char}): {st.session_state.characters[char]}"
+        if selected_chars:
+            context_budget = st.slider("Character Context Budget (tokens)", 100, 1500, DEFAULT_CONTEXT_BUDGET, step=50)
+            for char in selected_chars:
+                if char not in st.session_state.character_digests:
+                    st.session_state.character_digests[char] = make_digest(st.session_state.characters[char])
+            char_context, context_tokens = pack_character_context(
+                {char: st.session_state.character_digests[char] for char in selected_chars},
+                budget=context_budget, focus=idea
+            )
+            full_tokens = sum(count_tokens(st.session_state.characters[char]) for char in selected_chars)
+            st.caption(f"Character context: ~{context_tokens} tokens (full profiles: ~{full_tokens})")
 
         genre_context = st.text_input("Additional Context (Genre, Tone)", placeholder="Cyberpunk, Melancholic")
         full_context = f"{genre_context}\n{char_context}"
         
+        # Long-form: a beat outline first, then every scene drafted in parallel and stitched in order
+        long_form = st.toggle("Long-form screenplay (outline, then scenes)")
+        if long_form:
+            scene_count = st.slider("Number of Scenes", 4, 30, 12)
+        
         generate_btn = st.button("Generate Screenplay")
         
     with col2:
         st.subheader("Script Output")
-        if generate_btn and idea:
+        if generate_btn and idea and long_form:
+            with st.spinner(f"Outlining {scene_count} scene beats..."):
+                outline = ai.generate_beat_outline(idea, full_context, scene_count)
+            if isinstance(outline, str):
+                st.error(f"Failed to outline the screenplay: {outline}")
+            else:
+                with st.expander(f"📋 Beat Outline: {outline['title']}"):
+                    st.markdown("\n".join(f"{i + 1}. **{beat['heading']}**: {beat['summary']}" for i, beat in enumerate(outline["scenes"])))
+                scene_progress = st.progress(0, text=f"Drafting {len(outline['scenes'])} scenes in parallel...")
+                # One slot per scene in story order; each fills in as soon as its scene lands
+                scene_slots = [st.empty() for _ in outline["scenes"]]
+                
+                def on_scene(index, scene, done, total):
+                    scene_progress.progress(done / total, text=f"{done}/{total} scenes drafted")
+                    with scene_slots[index].expander(f"Scene {index + 1}: {outline['scenes'][index]['heading']}", expanded=index == 0):
+                        if scene.startswith("Error"):
+                            st.error(scene)
+                        else:
+                            st.markdown(f'<div class="output-container">{scene}</div>', unsafe_allow_html=True)
+                
+                scenes = ai.draft_outline_scenes(idea, outline, full_context, progress_callback=on_scene)
+                script, issues = ai.stitch_screenplay(outline, scenes)
+                scene_progress.progress(1.0, text=f"✅ {len(outline['scenes'])} scenes stitched into one draft")
+                if issues:
+                    st.warning("**Continuity check**\n" + "\n".join(f"- {issue}" for issue in issues))
+                st.session_state.scripts[f"Draft {len(st.session_state.scripts) + 1}: {outline['title']}"] = script
+                st.download_button("Download Screenplay", script, file_name="screenplay.txt")
+        elif generate_btn and idea:
             with st.spinner("AI is drafting the scene..."):
-                script = ai.generate_screenplay(idea, full_context)
+                script = render_stream(ai.generate_screenplay(idea, full_context, stream=True))
                 if script and not script.startswith("Error"):
-                    st.markdown(f'<div class="output-container">{script}</div>', unsafe_allow_html=True)
+                    st.session_state.scripts[f"Scene {len(st.session_state.scripts) + 1}"] = script
                     st.download_button("Download Script", script, file_name="script.txt")
                 else:
                     st.error(f"Failed to generate screenplay: {script}")
@@ -192,14 +453,18 @@ elif menu == "Character Studio":
         
     with col2:
         st.subheader("Character Profile")
-        if generate_btn and char_name:
+        regenerate = st.session_state.get("regenerate") == "character"
+        if (generate_btn or regenerate) and char_name:
+            st.session_state.pop("regenerate", None)
             with st.spinner("Analyzing character depths..."):
-                profile = ai.generate_character_profile(char_name, char_desc)
+                with generation_scope(regenerate) as reused:
+                    profile = render_stream(ai.generate_character_profile(char_name, char_desc, stream=True))
                 if profile and not profile.startswith("Error"):
                     # Store in session state for workflow automation
                     st.session_state.characters[char_name] = profile
-                    st.markdown(f'<div class="output-container">{profile}</div>', unsafe_allow_html=True)
+                    st.session_state.character_digests[char_name] = make_digest(profile)
                     st.download_button("Download Profile", profile, file_name=f"{char_name}_profile.txt")
+                    offer_regenerate(reused, "character")
                 else:
                     st.error(f"Failed to generate character profile: {profile}")
 
@@ -249,22 +514,31 @@ elif menu == "Sonic Soundscape Studio":
             
         with col2:
             st.subheader("Sound Design Guide")
-            if generate_btn and scene_desc:
+            regenerate = st.session_state.get("regenerate") == "sonic"
+            if (generate_btn or regenerate) and scene_desc:
+                st.session_state.pop("regenerate", None)
                 with st.spinner("Orchestrating the soundscape..."):
-                    sonic_plan = ai.generate_sound_design(scene_desc)
+                    # Blueprint and ML labels come back together from one structured call
+                    with generation_scope(regenerate) as reused:
+                        sonic_plan, label_list = ai.generate_sound_blueprint(scene_desc)
                     if sonic_plan and not sonic_plan.startswith("Error"):
                         st.markdown(f'<div class="output-container">{sonic_plan}</div>', unsafe_allow_html=True)
                         
                         # ML Labels
                         st.markdown("#### 🏷️ ML Dataset Labels")
-                        labels = ai.generate_ml_labels(sonic_plan)
-                        if labels and not labels.startswith("Error"):
-                            label_list = [l.strip() for l in labels.split(",")]
+                        if label_list:
                             cols = st.columns(len(label_list))
                             for i, label in enumerate(label_list):
                                 cols[i % len(cols)].info(f"Tag: {label}")
                         
+                        # Content-addressed, so reruns showing the same result do not add it twice
+                        get_label_dataset().append("Single Scene", scene_desc, sonic_plan, label_list, source="app")
+                        
+                        st.markdown("#### 🎧 Procedural Preview")
+                        st.audio(audio_preview(tuple(label_list or [scene_desc])), format="audio/wav")
+                        
                         st.download_button("Download Sonic Plan", sonic_plan, file_name="sound_design.txt")
+                        offer_regenerate(reused, "sonic")
                     else:
                         st.error(f"Failed to generate sonic plan: {sonic_plan}")
     
@@ -273,30 +547,54 @@ elif menu == "Sonic Soundscape Studio":
         st.markdown("Generate a series of high-quality sonic templates for game scenes, video scenes, and emotional moods.")
         
         if st.button("Generate Full Production Pack"):
-            with st.spinner("Generating 10-second studio blueprints..."):
-                # Define batch prompts
-                packs = [
-                    ("Jungle Temple", "Jungle temple environment with wind, insects, thunder, and footsteps. 10s."),
-                    ("Cyberpunk Night", "Cyberpunk street at night with rain, footsteps, traffic. 10s."),
-                    ("Emotional Mood", "Mood: Emotional. Soft piano and wind. 10s."),
-                    ("Horror Mood", "Mood: Horror. Low bass and whisper. 10s."),
-                    ("Action Mood", "Mood: Action. Fast drums and explosion. 10s."),
-                    ("Sci-Fi Mood", "Mood: Sci-fi. Futuristic synth and digital beeps. 10s.")
-                ]
-                
-                full_pack_output = "# Scriptoria Cinematic Sound Pack\n\n"
-                for title, prompt in packs:
-                    st.write(f"Orchestrating **{title}**...")
-                    bp = ai.generate_sound_design(prompt)
-                    labels = ai.generate_ml_labels(bp)
-                    full_pack_output += f"## {title}\n{bp}\n\n**ML Labels**: {labels}\n\n"
-                    
-                    with st.expander(f"View {title} Blueprint"):
-                        st.markdown(f'<div class="output-container">{bp}</div>', unsafe_allow_html=True)
-                        st.caption(f"ML Tags: {labels}")
-                
-                st.success("✅ Cinematic Sound Pack Complete!")
-                st.download_button("Download Complete Sound Pack", full_pack_output, file_name="scriptoria_sound_pack.txt")
+            # Define batch prompts
+            packs = [
+                ("Jungle Temple", "Jungle temple environment with wind, insects, thunder, and footsteps. 10s."),
+                ("Cyberpunk Night", "Cyberpunk street at night with rain, footsteps, traffic. 10s."),
+                ("Emotional Mood", "Mood: Emotional. Soft piano and wind. 10s."),
+                ("Horror Mood", "Mood: Horror. Low bass and whisper. 10s."),
+                ("Action Mood", "Mood: Action. Fast drums and explosion. 10s."),
+                ("Sci-Fi Mood", "Mood: Sci-fi. Futuristic synth and digital beeps. 10s.")
+            ]
+            # Runs in a background worker; the job id in the URL lets this page reattach to it
+            st.query_params["pack_job"] = get_job_queue().submit("sound_pack", {"scenes": packs}, api_key)
+        
+        def render_sound_pack(params, scenes):
+            descriptions = dict(params["scenes"])
+            get_label_dataset().extend(
+                dict(scene, description=descriptions.get(scene["title"], ""), source="app") for scene in scenes
+            )
+            full_pack_output = "# Scriptoria Cinematic Sound Pack\n\n"
+            # Scenes are listed in the order they finished, not in definition order
+            for scene in scenes:
+                full_pack_output += f"## {scene['title']}\n{scene['blueprint']}\n\n**ML Labels**: {', '.join(scene['labels'])}\n\n"
+                with st.expander(f"View {scene['title']} Blueprint"):
+                    st.markdown(f'<div class="output-container">{scene["blueprint"]}</div>', unsafe_allow_html=True)
+                    st.caption(f"ML Tags: {', '.join(scene['labels'])}")
+                    st.audio(audio_preview(tuple(scene["labels"] or [scene["title"]])), format="audio/wav")
+            
+            st.success("✅ Cinematic Sound Pack Complete!")
+            st.download_button("Download Complete Sound Pack", full_pack_output, file_name="scriptoria_sound_pack.txt")
+        
+        if "pack_job" in st.query_params:
+            show_job("pack_job", render_sound_pack)
+        
+        with st.expander("🗂️ ML Label Dataset"):
+            dataset = get_label_dataset()
+            stats = dataset.stats()
+            d1, d2, d3 = st.columns(3)
+            d1.metric("Records", stats["records"])
+            d2.metric("Labels", stats["labels"])
+            d3.metric("Shards", stats["shards"])
+            top_labels = dataset.vocabulary(limit=20)
+            if top_labels:
+                st.caption(" · ".join(f"{label} ({count})" for label, count in top_labels))
+            label_query = st.text_input("Find records by label", placeholder="Heavy rain")
+            if label_query:
+                record_ids = dataset.lookup(label_query)
+                st.caption(f"{len(record_ids)} records tagged '{label_query}'")
+                for record in reversed(list(dataset.records(record_ids[-20:]))):
+                    st.markdown(f"**{record['title']}** — {', '.join(record['labels'])}")
 
 elif menu == "Cine-Clip Architect":
     col1, col2 = st.columns([1, 1])
@@ -328,34 +626,34 @@ elif menu == "Clip Studio":
         v_idea = st.text_area("What should happen in the video?", placeholder="A dragon flying over a frozen city at night, breathing blue fire...")
         v_res = st.selectbox("Resolution", ["1080p (Cinematic)", "4K (Ultra)", "720p (Draft)"])
         v_fps = st.select_slider("Frame Rate", options=[24, 30, 60], value=24)
+        v_soundtrack = st.checkbox("Procedural soundtrack", help="Mixes an audio bed from ML sound labels into the MP4")
         prod_btn = st.button("Start AI Render")
         
     with col2:
         if prod_btn and v_idea:
-            # Step 1: Generate Prompt
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            
-            status_text.text("Step 1: Architecting Cinematic Prompt...")
-            v_prompt = ai.generate_video_prompt(v_idea)
-            progress_bar.progress(30)
-            
-            # Step 2: Generate Production Specs
-            status_text.text("Step 2: Calculating Motion Vectors & Camera Paths...")
-            v_specs = ai.get_video_production_data(v_idea)
-            progress_bar.progress(50)
-            
-            # Step 3: Generate Motion Script
-            status_text.text("Step 3: Generating 10-Second Automation Script...")
-            v_script = ai.generate_motion_script(v_idea)
-            progress_bar.progress(80)
-            
-            # Step 4: Finalize
-            status_text.text("Step 4: Architecting 10-Second Production Blueprint...")
-            v_storyboard = ai.generate_multi_frame_storyboard(v_idea)
-            progress_bar.progress(100)
-            
-            status_text.success("✅ Cinematic Production Blueprint Complete!")
+            clip_resolutions = {
+                "720p (Draft)": (1280, 720),
+                "1080p (Cinematic)": (1920, 1080),
+                "4K (Ultra)": (3840, 2160)
+            }
+            width, height = clip_resolutions[v_res]
+            # Steps 1-4 are architected in parallel, then rendered, all in a background worker;
+            # the job id in the URL lets this page reattach after a refresh or disconnect
+            release_clip_render()
+            st.query_params["clip_job"] = get_job_queue().submit(
+                "clip_render", {"idea": v_idea, "resolution": v_res, "width": width, "height": height, "fps": v_fps, "soundtrack": v_soundtrack},
+                api_key
+            )
+        elif prod_btn:
+            st.warning("Please enter a visual idea for the video.")
+        
+        def render_clip(params, clip_results):
+            v_idea = params["idea"]
+            v_prompt = clip_results["prompt"]
+            v_specs = clip_results["specs"]
+            v_script = clip_results["script"]
+            v_storyboard = clip_results["storyboard"]
+            video_path = clip_results["video_path"]
             
             # Blueprint Branding
             st.warning("🎬 **Scriptoria Production Blueprint**: This module generates high-fidelity cinematic plans, motion scripts, and storyboards to guide your production in industry-standard render engines.")
@@ -363,7 +661,19 @@ elif menu == "Clip Studio":
             # --- DYNAMIC VIDEO PRODUCTION PREVIEW ---
             st.subheader("🚀 High-Fidelity Production Preview")
             
-            # Motion Asset Library (Cinematic Mapping)
+            # Render workspaces are purged after an hour, so an old job may have lost its video
+            if video_path and os.path.exists(video_path):
+                with open(video_path, "rb") as f:
+                    st.video(f.read())
+                st.success("✅ Cinematic Production Blueprint & Preview Render Complete!")
+                st.caption(f"Rendered Production Preview ({params['resolution']}, {params['fps']} fps) for: '{v_idea}'")
+                if clip_results.get("soundtrack"):
+                    st.caption(f"🎧 Soundtrack: {', '.join(clip_results['soundtrack'])}")
+            else:
+                video_path = None
+                st.warning(f"Preview render unavailable ({clip_results['video_error'] or 'render expired'}). Showing a simulated preview instead.")
+            
+            # Motion Asset Library (Cinematic Mapping), used when the render fails
             motion_library = {
                 "dragon": "https://www.w3schools.com/html/mov_bbb.mp4", # Placeholder for animal/creature
                 "student": "https://sample-videos.com/video123/mp4/720/big_buck_bunny_720p_1mb.mp4",
@@ -382,8 +692,9 @@ elif menu == "Clip Studio":
                     selected_video = motion_library[key]
                     break
             
-            st.video(selected_video)
-            st.caption(f"Simulated Production Preview for: '{v_idea}'")
+            if not video_path:
+                st.video(selected_video)
+                st.caption(f"Simulated Production Preview for: '{v_idea}'")
             
             # --- MULTI-FRAME STORYBOARD ---
             st.markdown("---")
@@ -394,8 +705,8 @@ elif menu == "Clip Studio":
                 # Expecting format: Title: Beat 1, Timestamp: 0-2s, Visual: ..., Keywords: ...
                 beat_blocks = v_storyboard.split("Title:")[1:]
                 if beat_blocks:
-                    cols = st.columns(len(beat_blocks))
-                    for i, block in enumerate(beat_blocks):
+                    beats = []
+                    for block in beat_blocks:
                         ts_match = re.search(r"Timestamp: (.*?)(?:\n|,)", block)
                         vis_match = re.search(r"Visual: (.*?)(?:\n|,)", block)
                         kw_match = re.search(r"Keywords: (.*?)(\n|\Z)", block)
@@ -403,9 +714,19 @@ elif menu == "Clip Studio":
                         ts = ts_match.group(1).strip() if ts_match else "N/A"
                         vis = vis_match.group(1).strip() if vis_match else "Description pending..."
                         kw = kw_match.group(1).strip() if kw_match else "cinematic"
-                        
+                        beats.append((ts, vis, kw))
+                    
+                    # Beat images are fetched server-side in parallel and served from the local thumbnail cache
+                    with st.spinner("Rendering storyboard frames..."):
+                        beat_images = ai.fetch_storyboard_images([kw for _, _, kw in beats])
+                    
+                    cols = st.columns(len(beats))
+                    for i, (ts, vis, kw) in enumerate(beats):
                         with cols[i]:
-                            st.image(f"https://image.pollinations.ai/prompt/{kw.replace(' ', '%20')},film,cinematic?width=400&height=300&seed={i}", caption=f"Beat {i+1} ({ts})")
+                            if beat_images[i]:
+                                st.image(beat_images[i], caption=f"Beat {i+1} ({ts})")
+                            else:
+                                st.caption(f"Beat {i+1} ({ts}): frame unavailable")
                             st.write(f"**{ts}**")
                             st.caption(vis)
                 else:
@@ -423,24 +744,28 @@ elif menu == "Clip Studio":
                 st.code(v_specs)
                 st.markdown(f"**Master AI Production Prompt:**\n{v_prompt}")
         
-        elif prod_btn:
-            st.warning("Please enter a visual idea for the video.")
+        if "clip_job" in st.query_params:
+            show_job("clip_job", render_clip, on_dismiss=release_clip_render)
 
 elif menu == "Production Hub":
     st.subheader("🏢 Production Command Center")
     st.markdown("Centralize your pre-production workflow: from budget planning to crew selection.")
     
-    # Dashboard Metrics
+    # Dashboard Metrics (placeholders so "Architect All" can refresh them live)
     m1, m2, m3 = st.columns(3)
-    completed_plans = len(st.session_state.production_data)
-    total_categories = 8
-    progress_pct = (completed_plans / total_categories) * 100
+    metric_slots = (m1.empty(), m2.empty(), m3.empty())
+    readiness_bar = st.empty()
+    total_categories = len(PRODUCTION_DAG)
     
-    m1.metric("Completed Plans", completed_plans)
-    m2.metric("Production Readiness", f"{progress_pct:.0f}%")
-    m3.metric("Pending Tasks", total_categories - completed_plans)
+    def render_readiness():
+        completed_plans = len(st.session_state.production_data)
+        progress_pct = (completed_plans / total_categories) * 100
+        metric_slots[0].metric("Completed Plans", completed_plans)
+        metric_slots[1].metric("Production Readiness", f"{progress_pct:.0f}%")
+        metric_slots[2].metric("Pending Tasks", total_categories - completed_plans)
+        readiness_bar.progress(progress_pct / 100)
     
-    st.progress(progress_pct / 100)
+    render_readiness()
     st.markdown("---")
     
     col1, col2 = st.columns([1, 1])
@@ -453,37 +778,68 @@ elif menu == "Production Hub":
             ["Script Finalization", "Budget Planning", "Casting Studio", "Location Scout", "Storyboard Preparation", "Costume & Makeup", "Schedule Planning", "Crew Selection"]
         )
         plan_btn = st.button("Architect Milestone Blueprint")
+        all_btn = st.button("⚡ Architect All Milestones")
         
-        if plan_btn and prod_idea:
+        regenerate = st.session_state.get("regenerate") == "milestone"
+        if (plan_btn or regenerate) and prod_idea:
+            st.session_state.pop("regenerate", None)
             with st.spinner(f"Architecting {prod_category}..."):
-                blueprint = ai.generate_production_blueprint(prod_idea, prod_category)
+                # Build on whichever upstream plans already exist in the archive
+                upstream = ai.milestone_context(prod_category, st.session_state.production_data)
+                with generation_scope(regenerate) as reused:
+                    blueprint = render_stream(ai.generate_production_blueprint(prod_idea, prod_category, stream=True, context=upstream))
                 if blueprint and not blueprint.startswith("Error"):
                     st.session_state.production_data[prod_category] = blueprint
+                    render_readiness()
                     st.success(f"✅ {prod_category} Archive Updated!")
+                    offer_regenerate(reused, "milestone")
                 else:
                     st.error(f"Failed to generate {prod_category}: {blueprint}")
-        elif plan_btn:
+        elif all_btn and prod_idea:
+            milestone_status = st.empty()
+            failed = []
+            
+            def on_milestone(category, blueprint, done, total):
+                if blueprint.startswith("Error"):
+                    failed.append(category)
+                else:
+                    st.session_state.production_data[category] = blueprint
+                    render_readiness()
+                milestone_status.text(f"{done}/{total} milestones: {category} {'failed' if blueprint.startswith('Error') else 'ready'}")
+            
+            with st.spinner("Architecting Script Finalization, then every department in parallel..."):
+                ai.architect_all_milestones(prod_idea, progress_callback=on_milestone)
+            if failed:
+                st.error(f"Failed to generate: {', '.join(failed)}")
+            else:
+                milestone_status.success("✅ All milestones architected!")
+        elif plan_btn or all_btn:
             st.warning("Please enter a project concept.")
 
     with col2:
         st.subheader("🗄️ Project Archive")
-        if not st.session_state.production_data:
-            st.info("No plans generated yet. Architect your first milestone to see the archive.")
-        else:
-            # Sort keys to keep order consistent
-            for cat in sorted(st.session_state.production_data.keys()):
-                data = st.session_state.production_data[cat]
-                with st.expander(f"📄 {cat}"):
-                    st.markdown(f'<div class="output-container">{data}</div>', unsafe_allow_html=True)
-                    st.download_button(f"Download {cat}", data, file_name=f"{cat.lower().replace(' ', '_')}.txt", key=f"dl_{cat}")
+        render_archive()
 
     # Full Master Export
     if st.session_state.production_data:
         st.markdown("---")
-        master_book = "# Master Production Book\n\n"
-        for cat, data in st.session_state.production_data.items():
-            master_book += f"## {cat}\n{data}\n\n---\n\n"
-        st.download_button("🚀 Export Master Production Book", master_book, file_name="master_production_book.txt")
+        # Only sections whose plans changed since the last rerun are re-rendered
+        st.download_button("🚀 Export Master Production Book", st.session_state.master_book.text(), file_name="master_production_book.txt")
+        
+        scripts = st.session_state.scripts
+        plans = st.session_state.production_data
+        pdf_renderer = st.session_state.pdf_renderer
+        project_name = st.session_state.project_name
+        
+        def build_pdf_book():
+            # Runs only when the button is clicked; unchanged sections are replayed from the renderer's cache
+            book = io.BytesIO()
+            sections = [(name, scripts[name]) for name in scripts]
+            sections += [(cat, plans[cat]) for cat in plans]
+            pdf_renderer.render(sections, book, subtitle=project_name)
+            return book.getvalue()
+        
+        st.download_button("📕 Export Master Production Book (PDF)", build_pdf_book, file_name="master_production_book.pdf", mime="application/pdf")
 
 elif menu == "About":
     st.markdown("""
@@ -500,6 +856,46 @@ elif menu == "About":
     Powered by **Groq AI** and **Streamlit**.
     """)
 
+def render_performance(panel, telemetry):
+    """Shows recent engine calls, rolling latency percentiles per task and token spend per stage."""
+    recent = telemetry.ring.recent()
+    if not recent:
+        panel.caption("No engine calls yet.")
+        return
+    summary = telemetry.ring.summary()
+    live = [e for e in recent if not e["cached"]]
+    total_tokens = sum(e["prompt_tokens"] + e["completion_tokens"] for e in recent)
+    p50 = percentile([e["wall_s"] for e in live], 50)
+    p95 = percentile([e["wall_s"] for e in live], 95)
+    panel.caption(
+        f"{len(recent)} calls · p50 {p50 or 0:.2f}s · p95 {p95 or 0:.2f}s · "
+        f"{total_tokens:,} tokens · {len(recent) - len(live)} cached"
+    )
+    panel.markdown("**Latency by task**")
+    panel.dataframe([
+        {"task": task, "model": row["model"], "calls": row["calls"], "errors": row["errors"], "cached": row["cache_hits"],
+         "p50 s": row["p50_s"], "p95 s": row["p95_s"], "ttft p50 s": row["ttft_p50_s"], "queue p95 s": row["queue_p95_s"]}
+        for task, row in sorted(summary["tasks"].items())
+    ], hide_index=True)
+    panel.markdown("**Tokens by workflow stage**")
+    panel.dataframe([
+        {"stage": name, "calls": row["calls"], "prompt": row["prompt_tokens"], "completion": row["completion_tokens"]}
+        for name, row in sorted(summary["stages"].items(), key=lambda item: -(item[1]["prompt_tokens"] + item[1]["completion_tokens"]))
+    ], hide_index=True)
+    panel.markdown("**Recent calls**")
+    panel.dataframe([
+        {"time": time.strftime("%H:%M:%S", time.localtime(e["ts"])), "task": e["task"], "model": e["model"], "outcome": e["outcome"],
+         "wall s": e["wall_s"], "ttft s": e["ttft_s"], "queue s": e["queue_wait_s"],
+         "tokens": e["prompt_tokens"] + e["completion_tokens"]}
+        for e in recent[:20]
+    ], hide_index=True)
+    if METRICS_PORT:
+        panel.caption(f"Prometheus metrics: http://127.0.0.1:{METRICS_PORT}/metrics")
+
+# Tables are only built while the panel is open
+if ai.telemetry and perf_panel.open:
+    render_performance(perf_panel, ai.telemetry)
+
 # Footer
 st.markdown("---")
 st.caption("Scriptoria v1.0 | AI-Powered Film Pre-Production")
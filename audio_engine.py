@@ -0,0 +1,378 @@
+import io
+import zlib
+import wave
+import threading
+from functools import lru_cache
+import numpy as np
+
+SAMPLE_RATE = 48000
+PREVIEW_SECONDS = 10
+# Output peak after mixing (about -1 dBFS), and the fade at each end that keeps the loop click-free
+PEAK_LEVEL = 0.89
+FADE_SECONDS = 0.05
+
+# Label keywords -> (generator, gain, pan). A label plays every generator whose keywords it contains;
+# pan runs from -1 (left) to 1 (right)
+RECIPES = [
+    (("rain", "drizzle", "downpour", "storm"), "rain", 0.8, 0.0),
+    (("wind", "breeze", "gust", "howl"), "wind", 0.7, -0.3),
+    (("thunder", "lightning"), "thunder", 0.9, 0.2),
+    (("footstep", "step", "walk", "gravel"), "footsteps", 0.6, 0.15),
+    (("insect", "cricket", "cicada", "jungle"), "insects", 0.35, -0.5),
+    (("bird", "chirp", "forest"), "birds", 0.35, 0.5),
+    (("traffic", "car", "engine", "vehicle", "street"), "traffic", 0.6, -0.2),
+    (("crowd", "market", "chatter", "voices", "bustle"), "crowd", 0.55, 0.1),
+    (("water", "ocean", "wave", "river", "stream", "sea"), "water", 0.7, 0.0),
+    (("fire", "crackl", "flame", "torch"), "fire", 0.6, 0.25),
+    (("piano", "keys", "melody"), "piano", 0.5, 0.1),
+    (("synth", "pad", "drone", "futuristic", "sci-fi", "ambient", "emotional"), "pad", 0.45, 0.0),
+    (("bass", "sub", "rumble", "low"), "bass", 0.6, 0.0),
+    (("drum", "percussion", "kick", "beat", "action"), "drums", 0.7, 0.0),
+    (("explosion", "blast", "boom", "impact"), "explosion", 0.9, -0.1),
+    (("beep", "digital", "computer", "electronic", "blip"), "beeps", 0.35, 0.4),
+    (("whisper", "breath", "horror"), "whisper", 0.45, -0.4),
+    (("siren", "alarm"), "siren", 0.4, 0.35)
+]
+# Played when no label matches anything, so a preview is never silent
+DEFAULT_LAYERS = [("roomtone", 0.5, 0.0), ("pad", 0.3, 0.0)]
+
+_shared_preview_engine = None
+_shared_preview_engine_lock = threading.Lock()
+
+
+def match_layers(labels):
+    """Maps labels (or any descriptive text) to [(generator, gain, pan)], each generator at most once."""
+    layers, seen = [], set()
+    for label in labels:
+        text = label.lower()
+        for keywords, name, gain, pan in RECIPES:
+            if name not in seen and any(keyword in text for keyword in keywords):
+                layers.append((name, gain, pan))
+                seen.add(name)
+    return layers or list(DEFAULT_LAYERS)
+
+
+# --- Shared building blocks (cached per buffer length) ---
+
+@lru_cache(maxsize=32)
+def _fft_size(n):
+    return 1 << (n - 1).bit_length()
+
+
+@lru_cache(maxsize=8)
+def _time(n, sample_rate):
+    t = np.arange(n, dtype=np.float32) / sample_rate
+    t.flags.writeable = False
+    return t
+
+
+@lru_cache(maxsize=8)
+def _freqs(size, sample_rate):
+    """rfft bin frequencies, with bin 0 moved to 1 Hz so band responses can divide by it."""
+    freqs = np.fft.rfftfreq(size, 1.0 / sample_rate).astype(np.float32)
+    freqs[0] = 1.0
+    freqs.flags.writeable = False
+    return freqs
+
+
+@lru_cache(maxsize=32)
+def _band(size, sample_rate, low, high, tilt):
+    """Smooth band-pass magnitude response over rfft bins, with a spectral tilt in dB per octave / 6."""
+    freqs = _freqs(size, sample_rate)
+    response = 1.0 / (1.0 + (low / freqs) ** 4) / (1.0 + (freqs / high) ** 4) * (freqs / 1000.0) ** tilt
+    response[0] = 0.0
+    response.flags.writeable = False
+    return response
+
+
+def _normalize(signal):
+    rms = float(np.sqrt(np.dot(signal, signal) / len(signal)))
+    if rms > 0:
+        signal *= 0.25 / rms
+    return signal
+
+
+@lru_cache(maxsize=4)
+def _white_spectrum(size, seed):
+    """A white-noise spectrum over rfft bins; drawing it is most of the cost of a noise layer, so it is
+    drawn once and every noise layer takes its own rotation of it."""
+    rng = np.random.default_rng(seed)
+    spectrum = rng.standard_normal(2 * (size // 2 + 1), dtype=np.float32).view(np.complex64)
+    spectrum.flags.writeable = False
+    return spectrum
+
+
+def _shaped_noise(n, sample_rate, rng, low, high, tilt=0.0):
+    """Noise with its energy between `low` and `high` Hz: a random spectrum shaped in the frequency
+    domain and brought back with a single inverse FFT."""
+    size = _fft_size(n)
+    white = _white_spectrum(size, 0)
+    # Rolling the bins gives every layer different noise in each band, so layers stay uncorrelated
+    spectrum = np.roll(white, int(rng.integers(len(white))))
+    spectrum *= _band(size, sample_rate, low, high, tilt)
+    return _normalize(np.fft.irfft(spectrum, size)[:n])
+
+
+def _filtered(signal, sample_rate, low, high):
+    """Band-limits a short signal (a click or footstep burst) in the frequency domain."""
+    size = _fft_size(len(signal))
+    spectrum = np.fft.rfft(signal, size)
+    spectrum *= _band(size, sample_rate, low, high, 0.0)
+    return np.fft.irfft(spectrum, size)[:len(signal)]
+
+
+def _lfo(n, sample_rate, rate, depth, phase=0.0):
+    """Slow amplitude modulation between 1 - depth and 1."""
+    t = _time(n, sample_rate)
+    return (1.0 - depth * (0.5 + 0.5 * np.sin(2 * np.pi * rate * t + phase))).astype(np.float32)
+
+
+def _place(n, kernel, starts, gains=None):
+    """Sums copies of `kernel` starting at each sample index in `starts`."""
+    out = np.zeros(n, dtype=np.float32)
+    for i, start in enumerate(starts):
+        start = int(start)
+        if start >= n:
+            continue
+        length = min(len(kernel), n - start)
+        out[start:start + length] += kernel[:length] * (gains[i] if gains is not None else 1.0)
+    return out
+
+
+def _scatter(n, sample_rate, rng, per_second, low, high):
+    """Randomly timed clicks (raindrops, crackles): one short band-limited burst placed many times."""
+    length = int(0.006 * sample_rate)
+    click = _filtered(rng.standard_normal(length).astype(np.float32), sample_rate, low, high) * _decay(length, sample_rate, 0.0015, attack=0.0002)
+    count = int(per_second * n / sample_rate)
+    return _normalize(_place(n, click, rng.integers(0, n, count), rng.uniform(0.3, 1.0, count)))
+
+
+def _decay(length, sample_rate, seconds, attack=0.002):
+    t = np.arange(length, dtype=np.float32) / sample_rate
+    return (np.minimum(1.0, t / attack) * np.exp(-t / seconds)).astype(np.float32)
+
+
+def _tone(freq, length, sample_rate, harmonics=(1.0,)):
+    t = np.arange(length, dtype=np.float32) / sample_rate
+    return sum(amp * np.sin(2 * np.pi * freq * (k + 1) * t) for k, amp in enumerate(harmonics)).astype(np.float32)
+
+
+# --- Generators: (n, sample_rate, rng) -> mono float32 ---
+
+def _rain(n, sr, rng):
+    bed = _shaped_noise(n, sr, rng, 400, 9000, 0.3)
+    return bed + _scatter(n, sr, rng, 60, 2500, 9000) * 0.6
+
+
+def _wind(n, sr, rng):
+    return _shaped_noise(n, sr, rng, 80, 1200, -1.0) * _lfo(n, sr, 0.13, 0.75, rng.uniform(0, 6.28))
+
+
+def _onsets(n, sr, rng, count, tail):
+    """`count` random start samples that leave `tail` seconds before the end, or as close as a short clip allows."""
+    latest = max(0.0, n / sr - tail)
+    return rng.uniform(min(0.5, latest), latest, count) * sr
+
+
+def _thunder(n, sr, rng):
+    rumble = _shaped_noise(n, sr, rng, 25, 400, -1.5)
+    strikes = _onsets(n, sr, rng, 2, 4.0)
+    envelope = _place(n, _decay(int(4 * sr), sr, 1.4, attack=0.08), strikes, rng.uniform(0.7, 1.0, 2))
+    return rumble * envelope * 2.5
+
+
+def _footsteps(n, sr, rng):
+    step = _filtered(rng.standard_normal(int(0.09 * sr)).astype(np.float32), sr, 60, 1800) * _decay(int(0.09 * sr), sr, 0.025)
+    starts = np.arange(0.3, n / sr, 0.55) * sr + rng.normal(0, 0.02 * sr, len(np.arange(0.3, n / sr, 0.55)))
+    return _normalize(_place(n, step, np.clip(starts, 0, None), rng.uniform(0.6, 1.0, len(starts)))) * 1.6
+
+
+def _insects(n, sr, rng):
+    t = _time(n, sr)
+    chirp = np.sin(2 * np.pi * 4300 * t) + 0.6 * np.sin(2 * np.pi * 5200 * t)
+    pulses = (np.sin(2 * np.pi * 28 * t) > 0.3).astype(np.float32)
+    return _normalize((chirp * pulses * _lfo(n, sr, 0.4, 0.9)).astype(np.float32))
+
+
+def _birds(n, sr, rng):
+    length = int(0.12 * sr)
+    t = np.arange(length, dtype=np.float32) / sr
+    sweep = np.sin(2 * np.pi * (2600 * t + 9000 * t * t)).astype(np.float32) * _decay(length, sr, 0.05, attack=0.01)
+    count = int(1.2 * n / sr)
+    return _normalize(_place(n, sweep, rng.uniform(0, n, count), rng.uniform(0.4, 1.0, count)))
+
+
+def _traffic(n, sr, rng):
+    t = _time(n, sr)
+    return _shaped_noise(n, sr, rng, 30, 500, -0.8) * _lfo(n, sr, 0.08, 0.5) + 0.08 * np.sin(2 * np.pi * 55 * t)
+
+
+def _crowd(n, sr, rng):
+    return _shaped_noise(n, sr, rng, 200, 3000, -0.3) * _lfo(n, sr, 0.6, 0.3) * _lfo(n, sr, 2.3, 0.2)
+
+
+def _water(n, sr, rng):
+    return _shaped_noise(n, sr, rng, 100, 2500, -0.5) * _lfo(n, sr, 0.11, 0.8, rng.uniform(0, 6.28))
+
+
+def _fire(n, sr, rng):
+    return _shaped_noise(n, sr, rng, 60, 900, -1.0) * 0.7 + _scatter(n, sr, rng, 25, 1500, 7000) * 0.8
+
+
+def _piano(n, sr, rng):
+    # A slow i-VI-III-VII progression in A minor, one chord every 2.5 seconds
+    chords = [(220.0, 261.63, 329.63), (174.61, 220.0, 261.63), (130.81, 164.81, 196.0), (196.0, 246.94, 293.66)]
+    length = int(2.5 * sr)
+    envelope = _decay(length, sr, 0.9, attack=0.005)
+    out = np.zeros(n, dtype=np.float32)
+    for i, start in enumerate(range(0, n, length)):
+        note = sum(_tone(f, length, sr, (1.0, 0.4, 0.15)) for f in chords[i % len(chords)]) * envelope
+        out[start:start + length] += note[:n - start]
+    return _normalize(out)
+
+
+def _pad(n, sr, rng):
+    t = _time(n, sr)
+    voices = sum(np.sin(2 * np.pi * f * t) for f in (110.0, 110.6, 164.8, 220.3, 277.2))
+    return _normalize((voices * _lfo(n, sr, 0.05, 0.4)).astype(np.float32))
+
+
+def _bass(n, sr, rng):
+    t = _time(n, sr)
+    return _normalize((np.sin(2 * np.pi * 45 * t) * _lfo(n, sr, 0.25, 0.6)).astype(np.float32))
+
+
+def _drums(n, sr, rng):
+    length = int(0.3 * sr)
+    t = np.arange(length, dtype=np.float32) / sr
+    kick = np.sin(2 * np.pi * (45 * t + 250 * (1 - np.exp(-t / 0.03)) * 0.03)).astype(np.float32) * _decay(length, sr, 0.12)
+    snare = _filtered(rng.standard_normal(length).astype(np.float32), sr, 1500, 8000) * _decay(length, sr, 0.06)
+    beat = 0.5 * sr  # 120 bpm
+    kicks = _place(n, kick, np.arange(0, n, beat))
+    snares = _place(n, _normalize(snare), np.arange(beat / 2, n, beat))
+    return _normalize(kicks) * 1.4 + snares * 0.5
+
+
+def _explosion(n, sr, rng):
+    burst = _shaped_noise(int(3 * sr), sr, rng, 20, 3000, -1.0) * _decay(int(3 * sr), sr, 0.7, attack=0.005)
+    return _place(n, burst, _onsets(n, sr, rng, 1, 3.0)) * 3.0
+
+
+def _beeps(n, sr, rng):
+    count = int(1.5 * n / sr)
+    length = int(0.08 * sr)
+    out = np.zeros(n, dtype=np.float32)
+    for start, freq in zip(rng.integers(0, n - length, count), rng.choice([1200.0, 1600.0, 2000.0], count)):
+        out[start:start + length] += _tone(freq, length, sr) * _decay(length, sr, 0.04, attack=0.003)
+    return _normalize(out)
+
+
+def _whisper(n, sr, rng):
+    return _shaped_noise(n, sr, rng, 1500, 6000, 0.0) * _lfo(n, sr, 0.3, 0.95, rng.uniform(0, 6.28))
+
+
+def _siren(n, sr, rng):
+    t = _time(n, sr)
+    freq = 900 + 300 * np.sin(2 * np.pi * 0.25 * t)
+    # Phase is the running integral of frequency, so the pitch glides without discontinuities
+    phase = np.cumsum(freq, dtype=np.float64) * (2 * np.pi / sr)
+    return _normalize(np.sin(phase).astype(np.float32))
+
+
+def _roomtone(n, sr, rng):
+    return _shaped_noise(n, sr, rng, 60, 2000, -1.0)
+
+
+GENERATORS = {
+    "rain": _rain, "wind": _wind, "thunder": _thunder, "footsteps": _footsteps, "insects": _insects,
+    "birds": _birds, "traffic": _traffic, "crowd": _crowd, "water": _water, "fire": _fire,
+    "piano": _piano, "pad": _pad, "bass": _bass, "drums": _drums, "explosion": _explosion,
+    "beeps": _beeps, "whisper": _whisper, "siren": _siren, "roomtone": _roomtone
+}
+
+
+@lru_cache(maxsize=24)
+def render_layer(name, n, sample_rate, seed=0):
+    """Renders one generator as a read-only mono float32 buffer; repeat renders come from the cache."""
+    rng = np.random.default_rng([seed, zlib.crc32(name.encode("utf-8"))])
+    layer = np.ascontiguousarray(GENERATORS[name](n, sample_rate, rng), dtype=np.float32)
+    layer.flags.writeable = False
+    return layer
+
+
+class AudioPreviewEngine:
+    """Mixes label-driven procedural layers into a stereo preview.
+
+    The stereo mix, scratch and 16-bit PCM buffers are allocated once per engine and reused by every
+    render; layers come from the render_layer cache, so a repeat preview is a handful of in-place
+    multiply-adds. Renders are serialized by a lock because they share those buffers.
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE, seconds=PREVIEW_SECONDS):
+        self.sample_rate = sample_rate
+        self.seconds = seconds
+        self.n = int(sample_rate * seconds)
+        self._mix = np.zeros((2, self.n), dtype=np.float32)
+        self._scratch = np.empty(self.n, dtype=np.float32)
+        self._pcm = np.empty((self.n, 2), dtype=np.int16)
+        fade = int(FADE_SECONDS * sample_rate)
+        self._fade = np.linspace(0.0, 1.0, fade, dtype=np.float32)
+        self._lock = threading.Lock()
+        # Pays the one-off costs up front so the first preview only shapes and mixes: drawing the
+        # shared white-noise spectrum, planning the FFT size, the bin and time axes, and faulting in the
+        # mix buffers
+        size = _fft_size(self.n)
+        np.fft.irfft(_white_spectrum(size, 0), size)
+        _freqs(size, sample_rate)
+        _time(self.n, sample_rate)
+        self._scratch.fill(0.0)
+        self._pcm.fill(0)
+
+    def _render(self, labels, seed):
+        mix, scratch = self._mix, self._scratch
+        mix.fill(0.0)
+        # Decorrelates the channels of a centred layer a little, for width
+        offset = int(0.011 * self.sample_rate)
+        for name, gain, pan in match_layers(labels):
+            layer = render_layer(name, self.n, self.sample_rate, seed)
+            # Constant-power pan
+            angle = (pan + 1.0) * np.pi / 4
+            np.multiply(layer, gain * np.cos(angle), out=scratch)
+            mix[0] += scratch
+            np.multiply(layer, gain * np.sin(angle), out=scratch)
+            mix[1, offset:] += scratch[:-offset]
+            mix[1, :offset] += scratch[-offset:]
+
+        peak = max(float(mix.max()), -float(mix.min()))
+        if peak > 0:
+            mix *= PEAK_LEVEL / peak
+        fade = len(self._fade)
+        mix[:, :fade] *= self._fade
+        mix[:, -fade:] *= self._fade[::-1]
+        np.multiply(mix.T, 32767.0, out=self._pcm, casting="unsafe")
+        return self._pcm
+
+    def render_wav(self, labels, seed=0):
+        """Returns a WAV file (bytes, 16-bit stereo) previewing the given labels."""
+        with self._lock:
+            pcm = self._render(labels, seed)
+            buffer = io.BytesIO()
+            with wave.open(buffer, "wb") as wav:
+                wav.setnchannels(2)
+                wav.setsampwidth(2)
+                wav.setframerate(self.sample_rate)
+                wav.writeframes(pcm.tobytes())
+        return buffer.getvalue()
+
+    def write_wav(self, path, labels, seed=0):
+        with open(path, "wb") as f:
+            f.write(self.render_wav(labels, seed))
+
+
+def get_shared_preview_engine():
+    """Returns the process-wide 10-second preview engine (and its preallocated buffers)."""
+    global _shared_preview_engine
+    with _shared_preview_engine_lock:
+        if _shared_preview_engine is None:
+            _shared_preview_engine = AudioPreviewEngine()
+        return _shared_preview_engine
@@ -0,0 +1,194 @@
+"""Local stand-in for the Groq chat-completions API and the Pollinations image endpoint.
+
+Lets the benchmarks (and manual testing) exercise AIEngine without spending API quota:
+
+    python benchmarks/fake_server.py --port 8765 --latency 0.3 --token-rate 250 --error-rate 0.05
+
+Point the engine at it with AIEngine(base_url=..., image_api_url=...) or the GROQ_BASE_URL and
+POLLINATIONS_URL environment variables.
+"""
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+WORDS = ("the camera drifts through rain soaked neon alleys while thunder rolls over the skyline and "
+         "footsteps echo beneath flickering signs as the hero steps into frame").split()
+
+
+class FakeServerConfig:
+    def __init__(self, latency=0.3, token_rate=250.0, error_rate=0.0, completion_tokens=400, image_latency=0.2, seed=0):
+        self.latency = latency                      # seconds before the first token / byte
+        self.token_rate = token_rate                # generated tokens per second
+        self.error_rate = error_rate                # fraction of requests answered with 429/500
+        self.completion_tokens = completion_tokens  # tokens generated per completion (capped by max_tokens)
+        self.image_latency = image_latency
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def roll_error(self):
+        with self.lock:
+            self.requests += 1
+            return self.random.random() < self.error_rate
+
+
+def _completion_text(body, tokens):
+    system = body["messages"][0]["content"]
+    if (body.get("response_format") or {}).get("type") == "json_object" and '"scenes"' in system:
+        count = int(re.search(r"exactly\s+(\d+)\s+scenes", system).group(1))
+        return json.dumps({"title": "Neon Garden", "scenes": [
+            {"heading": f"INT. LOCATION {i + 1} - NIGHT", "summary": " ".join(WORDS[i % 8:i % 8 + 12]) + ".",
+             "characters": ["DETECTIVE", "GARDENER"]}
+            for i in range(count)
+        ]})
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        section = " ".join(WORDS[i % len(WORDS)] for i in range(max(1, tokens // 4)))
+        return json.dumps({
+            "ambient_atmosphere": section, "foley_effects": section, "musical_cues": section, "sound_transitions": section,
+            "labels": ["Rain", "Thunder", "Footsteps on Gravel", "Wind", "Distant Siren"]
+        })
+    if "drafting one scene" in system:
+        heading = re.search(r"THIS SCENE \(\d+ of \d+\): (.*?):", body["messages"][1]["content"]).group(1)
+        action = " ".join(WORDS[i % len(WORDS)] for i in range(max(1, tokens - 20)))
+        return f"{heading}\n\n{action}.\n\nDETECTIVE\nWe are not alone in here.\n\nGARDENER\n(quietly)\nWe never were."
+    if "separated by '|'" in system:
+        return " | ".join(" ".join(WORDS[i:i + 8]) for i in range(5))
+    if "comma-separated list" in system:
+        return "Rain, Thunder, Footsteps on Gravel, Wind, Distant Siren"
+    return " ".join(WORDS[i % len(WORDS)] for i in range(tokens))
+
+
+_image_cache = {}
+
+
+def _jpeg(width, height, seed):
+    key = (width, height, seed % 8)
+    if key not in _image_cache:
+        import numpy as np
+        import imageio.v3 as iio
+        y, x = np.mgrid[0:height, 0:width]
+        shift = (seed % 8) * 32
+        frame = np.stack([(x * 255 // max(width, 1) + shift) % 256, y * 255 // max(height, 1), ((x + y) // 4 + shift) % 256], axis=-1)
+        _image_cache[key] = iio.imwrite("<bytes>", frame.astype(np.uint8), extension=".jpg")
+    return _image_cache[key]
+
+
+def make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body=b"", content_type="application/json", headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_error(self):
+            if config.random.random() < 0.7:
+                payload = json.dumps({"error": {"message": "Rate limit reached", "type": "tokens"}}).encode()
+                self._send(429, payload, headers={"retry-after": "1"})
+            else:
+                self._send(500, json.dumps({"error": {"message": "Internal error"}}).encode())
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                return self._send(404)
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            time.sleep(config.latency)
+            if config.roll_error():
+                return self._send_error()
+
+            tokens = min(config.completion_tokens, body.get("max_tokens") or config.completion_tokens)
+            text = _completion_text(body, tokens)
+            prompt_tokens = sum(len(m["content"]) for m in body["messages"]) // 4
+            completion_tokens = max(1, len(text) // 4)
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                     "total_tokens": prompt_tokens + completion_tokens}
+
+            if body.get("stream"):
+                return self._stream(body, text, usage)
+            time.sleep(completion_tokens / config.token_rate)
+            payload = {
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": body["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage
+            }
+            self._send(200, json.dumps(payload).encode())
+
+        def _stream(self, body, text, usage):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def write_event(data):
+                chunk = f"data: {data}\n\n".encode()
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                self.wfile.flush()
+
+            pieces = text.split(" ")
+            delay = 1.0 / config.token_rate
+            for i, piece in enumerate(pieces):
+                event = {
+                    "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": body["model"],
+                    "choices": [{"index": 0, "delta": {"content": piece + (" " if i < len(pieces) - 1 else "")}, "finish_reason": None}]
+                }
+                if i == len(pieces) - 1:
+                    event["choices"][0]["finish_reason"] = "stop"
+                    event["x_groq"] = {"id": "fake", "usage": usage}
+                write_event(json.dumps(event))
+                time.sleep(delay)
+            write_event("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if not url.path.startswith("/prompt/"):
+                return self._send(404)
+            query = parse_qs(url.query)
+            time.sleep(config.image_latency)
+            if config.roll_error():
+                return self._send(503)
+            width = int(query.get("width", ["1024"])[0])
+            height = int(query.get("height", ["576"])[0])
+            seed = int(query.get("seed", ["0"])[0])
+            self._send(200, _jpeg(width, height, seed), content_type="image/jpeg")
+
+    return Handler
+
+
+def start_server(config=None, port=0):
+    """Starts the stand-in on a daemon thread and returns (server, base_url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(config or FakeServerConfig()))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Groq + Pollinations server for local benchmarking.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--token-rate", type=float, default=250.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--completion-tokens", type=int, default=400)
+    args = parser.parse_args()
+    config = FakeServerConfig(args.latency, args.token_rate, args.error_rate, args.completion_tokens)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(config))
+    print(f"Fake Groq/Pollinations server on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
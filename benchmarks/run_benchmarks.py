@@ -0,0 +1,334 @@
+"""Benchmarks every AIEngine workflow against the local fake server.
+
+    python benchmarks/run_benchmarks.py --iterations 5 --latency 0.3 --token-rate 250
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/abc123.json benchmarks/results/def456.json
+
+Each run writes benchmarks/results/<commit>.json (or --output) with p50/p95/p99 latency,
+throughput and error counts per case, plus peak RSS, so results can be diffed across commits.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from ai_engine import AIEngine, StreamInterrupted  # noqa: E402
+from audio_engine import AudioPreviewEngine, render_layer  # noqa: E402
+from image_cache import ImageCache  # noqa: E402
+from response_cache import ResponseCache  # noqa: E402
+from request_scheduler import get_scheduler  # noqa: E402
+from benchmarks.fake_server import FakeServerConfig, start_server  # noqa: E402
+
+IDEA = "A cybernetic detective discovers a forgotten garden in a neon city"
+SCENES = [
+    ("Jungle Temple", "Jungle temple environment with wind, insects, thunder, and footsteps. 10s."),
+    ("Cyberpunk Night", "Cyberpunk street at night with rain, footsteps, traffic. 10s."),
+    ("Emotional Mood", "Mood: Emotional. Soft piano and wind. 10s."),
+    ("Horror Mood", "Mood: Horror. Low bass and whisper. 10s."),
+    ("Action Mood", "Mood: Action. Fast drums and explosion. 10s."),
+    ("Sci-Fi Mood", "Mood: Sci-fi. Futuristic synth and digital beeps. 10s.")
+]
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024
+
+
+def is_failure(result):
+    if isinstance(result, str):
+        return result.startswith("Error")
+    if isinstance(result, tuple) and len(result) == 2 and result[0] is None:
+        return True  # generate_ai_video returns (None, error)
+    if isinstance(result, tuple) and result and isinstance(result[0], str):
+        return result[0].startswith("Error")  # generate_sound_blueprint returns (blueprint, labels)
+    return False
+
+
+def run_case(name, fn, iterations, items_per_call=1):
+    """Times `fn` repeatedly and returns its latency distribution and throughput."""
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        call_started = time.perf_counter()
+        try:
+            if is_failure(fn()):
+                errors += 1
+        except Exception as e:
+            print(f"  {name}: {e}", file=sys.stderr)
+            errors += 1
+        latencies.append(time.perf_counter() - call_started)
+    wall = time.perf_counter() - started
+    result = {
+        "iterations": iterations,
+        "errors": errors,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "mean": sum(latencies) / len(latencies),
+        "throughput_per_s": iterations * items_per_call / wall if wall else 0.0,
+        "peak_rss_mb": peak_rss_mb()
+    }
+    print(f"{name:<34} p50 {result['p50'] * 1000:8.1f}ms  p95 {result['p95'] * 1000:8.1f}ms  "
+          f"p99 {result['p99'] * 1000:8.1f}ms  {result['throughput_per_s']:7.2f}/s  errors {errors}")
+    return result
+
+
+def time_to_first_chunk(ai):
+    started = time.perf_counter()
+    stream = ai.generate_screenplay(IDEA, stream=True)
+    first = None
+    try:
+        for _ in stream:
+            if first is None:
+                first = time.perf_counter() - started
+    except StreamInterrupted:
+        pass  # the first chunk still arrived; only time to it is measured here
+    return first
+
+
+def encode_only(width, height, fps, duration=10):
+    """Renders motion from synthetic keyframes and encodes it, isolating CPU cost from the network."""
+    import numpy as np
+    import imageio
+    from motion_synthesis import render_motion
+
+    y, x = np.mgrid[0:576, 0:1024]
+    keyframes = [np.stack([(x // 4 + i * 40) % 256, (y // 3) % 256, ((x + y) // 6) % 256], axis=-1).astype(np.uint8) for i in range(5)]
+    path = os.path.join(tempfile.mkdtemp(prefix="scriptoria_bench_"), "encode.mp4")
+    with imageio.get_writer(path, fps=fps, codec="libx264", macro_block_size=8, ffmpeg_params=["-preset", "ultrafast"]) as writer:
+        for batch in render_motion(keyframes, width, height, fps, duration):
+            for frame in batch:
+                writer.append_data(frame)
+    os.remove(path)
+    os.rmdir(os.path.dirname(path))
+
+
+def long_screenplay(ai, scene_count):
+    """Outline, concurrent scene drafts and stitching: the Screenplay Generator's long-form mode."""
+    outline = ai.generate_beat_outline(IDEA, scene_count=scene_count)
+    if isinstance(outline, str):
+        return outline
+    screenplay, _ = ai.stitch_screenplay(outline, ai.draft_outline_scenes(IDEA, outline))
+    return screenplay
+
+
+SALVAGER = "A weary old space salvager haunted by a lost crew"
+# (task, stored prompts, new prompt, should the semantic cache reuse a stored answer?)
+SEMANTIC_PAIRS = [
+    ("sound_blueprint", ["A moon base heist"], "Moon-base heist short film", True),
+    ("sound_blueprint", ["heist on a moon base"], "a moon base heist", True),
+    ("sound_blueprint", ["Cyberpunk street at night with rain, footsteps, traffic."], "cyberpunk street at night with rain footsteps and traffic", True),
+    ("sound_blueprint", ["A moon base heist"], "A moon base romance", False),
+    ("sound_blueprint", ["Cyberpunk street at night with rain, footsteps, traffic."], "Cyberpunk street at night with rain, footsteps, traffic, and gunfire.", False),
+    ("sound_blueprint", ["Jungle temple with wind, insects, thunder, and footsteps."], "Jungle temple with wind, insects, thunder, and no footsteps.", False),
+    ("sound_blueprint", ["Mood: Horror. Low bass and whisper."], "Mood: Horror. Low bass and scream.", False),
+    ("production_blueprint", ["A heist on a moon base during a solar storm"], "A heist on a moon base during the solar storms", True),
+    ("production_blueprint", ["A heist on a moon base during a solar storm"], "A heist on a moon base during a fierce solar storm", True),
+    ("production_blueprint", ["A heist on a moon base during a solar storm"], "A heist on a mars base during a solar storm", False),
+    ("production_blueprint", ["A heist on a moon base that succeeds"], "A heist on a moon base that never succeeds", False),
+    ("character_profile", ["A weary space salvager haunted by a lost crew"], SALVAGER, True),
+    ("character_profile", ["A weary space salvager haunted by a lost crew"], "A cheerful space salvager haunted by a lost crew", False),
+    # The closest entry differs by a negation; the next one is a valid match
+    ("character_profile", ["A weary old space salvager haunted by no lost crew", "A weary space salvager haunted by a lost crew"], SALVAGER, True)
+]
+
+
+def semantic_contrast():
+    """Checks every SEMANTIC_PAIRS case against a throwaway semantic cache; returns "Error: ..." on any mistake."""
+    from semantic_cache import SemanticCache
+    workdir = tempfile.mkdtemp(prefix="scriptoria_bench_")
+    cache = SemanticCache(path=os.path.join(workdir, "semantic.sqlite"), max_items=64)
+    wrong = []
+    for i, (task, stored, prompt, reuse) in enumerate(SEMANTIC_PAIRS):
+        # One scope per pair, so pairs cannot match each other's entries
+        for text in stored:
+            cache.add(task, str(i), text, f"answer {i}")
+        if (cache.lookup(task, str(i), prompt) is not None) != reuse:
+            wrong.append(f"{'missed' if reuse else 'reused'} {prompt!r} for {stored!r}")
+    for mistake in wrong:
+        print(f"  semantic_contrast: {mistake}", file=sys.stderr)
+    return f"Error: {len(wrong)} semantic cache mistakes" if wrong else "ok"
+
+
+def batch_runner(base_url, scenes, with_cache=False):
+    """Runs the generate_sound_pack.py CLI end to end into a throwaway checkpoint file and cache."""
+    import generate_sound_pack
+    workdir = tempfile.mkdtemp(prefix="scriptoria_bench_")
+    scenes_path = os.path.join(workdir, "scenes.jsonl")
+    with open(scenes_path, "w", encoding="utf-8") as f:
+        for i, (title, description) in enumerate(scenes):
+            f.write(json.dumps({"id": f"s{i}", "title": title, "description": description}) + "\n")
+    os.environ["GROQ_BASE_URL"] = base_url
+    try:
+        # Fake results must not reach the user's real label dataset or caches
+        cli_args = ["--input", scenes_path, "--output", os.path.join(workdir, "out.jsonl"), "--api-key", "bench",
+                    "--no-dataset", "--no-semantic-cache"]
+        cli_args += ["--cache", os.path.join(workdir, "responses.sqlite")] if with_cache else ["--no-cache"]
+        return generate_sound_pack.main(cli_args)
+    finally:
+        os.environ.pop("GROQ_BASE_URL", None)
+
+
+def run_all(args):
+    config = FakeServerConfig(latency=args.latency, token_rate=args.token_rate, error_rate=args.error_rate,
+                              completion_tokens=args.completion_tokens, image_latency=args.image_latency)
+    server, base_url = start_server(config)
+    # Quotas are effectively unlimited unless the scheduler itself is under test; registering them for the
+    # "bench" key also covers engines the batch runner builds internally
+    scheduler = get_scheduler("bench", requests_per_minute=args.rpm, tokens_per_minute=args.tpm, base_delay=0.2)
+    # Caches live in a throwaway directory: the fake server's filler text must never be served to the app
+    workdir = tempfile.mkdtemp(prefix="scriptoria_bench_")
+    ai = AIEngine(api_key="bench", base_url=base_url, image_api_url=base_url, scheduler=scheduler, semantic_cache=False,
+                  cache=ResponseCache(path=os.path.join(workdir, "responses.sqlite")) if args.with_cache else False,
+                  image_cache=ImageCache(path=os.path.join(workdir, "images")) if args.with_cache else False)
+    n = args.iterations
+
+    cases = {}
+    single_calls = {
+        "generate_screenplay": lambda: ai.generate_screenplay(IDEA, "Neo-noir"),
+        "generate_character_profile": lambda: ai.generate_character_profile("Elias Vance", "A weary space salvager"),
+        "generate_sound_design": lambda: ai.generate_sound_design(SCENES[0][1]),
+        "generate_ml_labels": lambda: ai.generate_ml_labels("Rain on tin roofs, distant thunder, footsteps."),
+        "generate_sound_blueprint": lambda: ai.generate_sound_blueprint(SCENES[0][1]),
+        "generate_video_prompt": lambda: ai.generate_video_prompt(IDEA),
+        "get_video_production_data": lambda: ai.get_video_production_data(IDEA),
+        "generate_motion_script": lambda: ai.generate_motion_script(IDEA),
+        "generate_multi_frame_storyboard": lambda: ai.generate_multi_frame_storyboard(IDEA),
+        "analyze_face_identity": lambda: ai.analyze_face_identity("Sharp cheekbones, silver hair"),
+        "generate_face_anchored_script": lambda: ai.generate_face_anchored_script("Enigmatic, heroic aura"),
+        "generate_production_blueprint": lambda: ai.generate_production_blueprint(IDEA, "Budget Planning")
+    }
+    print(f"--- Single calls (fake latency {args.latency}s, {args.token_rate} tok/s, error rate {args.error_rate}) ---")
+    for name, fn in single_calls.items():
+        cases[name] = run_case(name, fn, n)
+
+    ttft = [time_to_first_chunk(ai) for _ in range(n)]
+    cases["screenplay_time_to_first_chunk"] = {
+        "iterations": n, "errors": 0, "p50": percentile(ttft, 50), "p95": percentile(ttft, 95),
+        "p99": percentile(ttft, 99), "mean": sum(ttft) / n, "throughput_per_s": 0.0, "peak_rss_mb": peak_rss_mb()
+    }
+    print(f"{'screenplay_time_to_first_chunk':<34} p50 {cases['screenplay_time_to_first_chunk']['p50'] * 1000:8.1f}ms")
+
+    print("--- Flows ---")
+    clip_calls = {
+        "prompt": (ai.generate_video_prompt, (IDEA,)),
+        "specs": (ai.get_video_production_data, (IDEA,)),
+        "script": (ai.generate_motion_script, (IDEA,)),
+        "storyboard": (ai.generate_multi_frame_storyboard, (IDEA,))
+    }
+    cases["clip_studio_fan_out"] = run_case("clip_studio_fan_out", lambda: ai.run_concurrent(clip_calls), n)
+    cases["sound_pack_6_scenes"] = run_case("sound_pack_6_scenes", lambda: list(ai.generate_sound_pack(SCENES)), n, len(SCENES))
+    cases["architect_all_milestones"] = run_case("architect_all_milestones", lambda: ai.architect_all_milestones(IDEA), n, 8)
+    cases["long_screenplay_30_scenes"] = run_case("long_screenplay_30_scenes", lambda: long_screenplay(ai, 30), n, 30)
+    batch_scenes = [(f"{title} {i}", description) for i in range(args.batch_scenes // len(SCENES) + 1) for title, description in SCENES][:args.batch_scenes]
+    cases["batch_runner"] = run_case("batch_runner", lambda: batch_runner(base_url, batch_scenes, args.with_cache), 1, len(batch_scenes))
+
+    print("--- Semantic cache ---")
+    cases["semantic_contrast"] = run_case("semantic_contrast", semantic_contrast, 1, len(SEMANTIC_PAIRS))
+
+    print("--- Audio ---")
+    preview = AudioPreviewEngine()
+    labels = ["Heavy Rain", "Thunder", "Footsteps on Gravel", "Distant Traffic", "Synth Pad"]
+    def cold_preview():
+        render_layer.cache_clear()
+        return preview.render_wav(labels)
+    cases["audio_preview_cold"] = run_case("audio_preview_cold", cold_preview, n)
+    cases["audio_preview_warm"] = run_case("audio_preview_warm", lambda: preview.render_wav(labels), n)
+
+    if not args.skip_video:
+        print("--- Video ---")
+        def render():
+            path, error = ai.generate_ai_video(IDEA, width=1280, height=720, fps=24)
+            if path:
+                ai.cleanup_job(path)
+            return path, error
+        cases["generate_ai_video_720p24"] = run_case("generate_ai_video_720p24", render, max(1, n // 2))
+        cases["encode_1080p24_10s"] = run_case("encode_1080p24_10s", lambda: encode_only(1920, 1080, 24), max(1, n // 2))
+
+    server.shutdown()
+    return {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "peak_rss_mb": peak_rss_mb(),
+        "cases": cases
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(baseline_path, candidate_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(candidate_path, encoding="utf-8") as f:
+        candidate = json.load(f)
+    print(f"{'case':<34} {'p50 base':>10} {'p50 new':>10} {'change':>8} {'p95 base':>10} {'p95 new':>10} {'change':>8}")
+    for name, new in candidate["cases"].items():
+        old = baseline["cases"].get(name)
+        if not old:
+            print(f"{name:<34} (new case)")
+            continue
+        row = [name]
+        for key in ("p50", "p95"):
+            change = (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            row += [f"{old[key] * 1000:9.1f}ms", f"{new[key] * 1000:9.1f}ms", f"{change:+7.1f}%"]
+        print(f"{row[0]:<34} {row[1]:>10} {row[2]:>10} {row[3]:>8} {row[4]:>10} {row[5]:>10} {row[6]:>8}")
+    print(f"peak RSS: {baseline['peak_rss_mb']:.0f} MB ({baseline['commit']}) -> {candidate['peak_rss_mb']:.0f} MB ({candidate['commit']})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Scriptoria against a local fake Groq/Pollinations server.")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.3, help="Fake server seconds before first token.")
+    parser.add_argument("--token-rate", type=float, default=250.0, help="Fake server generated tokens per second.")
+    parser.add_argument("--completion-tokens", type=int, default=400)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of fake requests answered with 429/500.")
+    parser.add_argument("--image-latency", type=float, default=0.2)
+    parser.add_argument("--batch-scenes", type=int, default=24, help="Scenes pushed through the batch runner.")
+    parser.add_argument("--rpm", type=int, default=1_000_000, help="Scheduler requests-per-minute quota.")
+    parser.add_argument("--tpm", type=int, default=1_000_000_000, help="Scheduler tokens-per-minute quota.")
+    parser.add_argument("--with-cache", action="store_true", help="Keep the response and image caches enabled (in a throwaway directory).")
+    parser.add_argument("--skip-video", action="store_true")
+    parser.add_argument("--output", help="Results file (defaults to benchmarks/results/<commit>.json).")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"), help="Diff two results files and exit.")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    results = run_all(args)
+    output = args.output or os.path.join(REPO_ROOT, "benchmarks", "results", f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output} (peak RSS {results['peak_rss_mb']:.0f} MB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+import re
+
+# Digest fields in the order they are worth spending prompt tokens on when writing a scene
+FIELD_PRIORITY = ("Personality", "Motivation", "Conflict", "Backstory", "Notes")
+FIELD_KEYWORDS = {
+    "Personality": ("personality", "trait", "aura", "temperament", "voice"),
+    "Motivation": ("motivation", "goal", "desire", "want"),
+    "Conflict": ("conflict", "flaw", "fear", "struggle", "obstacle"),
+    "Backstory": ("backstory", "background", "history", "origin", "past")
+}
+DEFAULT_CONTEXT_BUDGET = 400
+# Longer sentences are clipped so a single piece can't swallow the whole budget
+MAX_SENTENCE_WORDS = 40
+
+_TOKEN_PATTERN = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+_MARKUP = re.compile(r"[*_`#>]+")
+_LIST_MARKER = re.compile(r"^\s*(?:[-•]|\d+[.)])\s*")
+
+
+def count_tokens(text):
+    """Approximates the model's token count locally, without a tokenizer round trip.
+
+    Words count one token per four letters (BPE splits long words), numbers and punctuation one each.
+    """
+    return sum((len(piece) + 3) // 4 if piece[0].isalpha() else 1 for piece in _TOKEN_PATTERN.findall(text))
+
+
+def _clean(line):
+    return _LIST_MARKER.sub("", _MARKUP.sub("", line)).strip()
+
+
+def _heading_field(text):
+    """Maps a short heading such as "Core Motivations" or "External/Internal Conflicts" to a digest field."""
+    words = text.strip().lower()
+    if not words or len(words.split()) > 4:
+        return None
+    for field, keywords in FIELD_KEYWORDS.items():
+        if any(keyword in words for keyword in keywords):
+            return field
+    return None
+
+
+def make_digest(profile):
+    """Condenses a generated character profile into {field: [sentences]} ordered by FIELD_PRIORITY.
+
+    Meant to run once when the profile is created; the digest is what gets packed into prompts.
+    """
+    fields = {field: [] for field in FIELD_PRIORITY}
+    current = "Notes"
+    for line in profile.splitlines():
+        text = _clean(line)
+        heading, _, rest = text.partition(":")
+        field = _heading_field(heading)
+        if field:
+            # "Backstory: Raised on ..." carries its first sentence on the heading line
+            current, text = field, rest.strip()
+        for sentence in _SENTENCE_SPLIT.split(text):
+            words = sentence.split()
+            if words:
+                fields[current].append(" ".join(words[:MAX_SENTENCE_WORDS]))
+    return {field: sentences for field, sentences in fields.items() if sentences}
+
+
+def pack_character_context(digests, budget=DEFAULT_CONTEXT_BUDGET, focus=""):
+    """Packs character digests into at most `budget` tokens of prompt context.
+
+    `digests` maps a character name to make_digest() output. Every character first gets the
+    lead sentence of its most important fields, then deeper sentences are added breadth-first while
+    budget remains, so the prompt stays bounded no matter how many characters are linked.
+    Characters named in `focus` (typically the scene idea) are filled first. Returns (context, tokens).
+    """
+    focus = focus.lower()
+    names = sorted(digests, key=lambda name: name.lower() not in focus)
+    candidates = []
+    for rank, name in enumerate(names):
+        for priority, field in enumerate(FIELD_PRIORITY):
+            for depth, sentence in enumerate(digests[name].get(field, [])):
+                candidates.append((depth, priority, rank, name, field, sentence))
+    candidates.sort(key=lambda c: c[:3])
+
+    chosen = {}
+    used = 0
+    for depth, priority, rank, name, field, sentence in candidates:
+        fields = chosen.get(name, {})
+        cost = count_tokens(sentence)
+        if field not in fields:
+            cost += count_tokens(f"{field}: |") if fields else count_tokens(f"Character ({name}): {field}:")
+        if used + cost > budget:
+            continue
+        chosen.setdefault(name, {}).setdefault(field, []).append(sentence)
+        used += cost
+
+    blocks = []
+    for name in names:
+        if name in chosen:
+            parts = [f"{field}: {' '.join(chosen[name][field])}" for field in FIELD_PRIORITY if field in chosen[name]]
+            blocks.append(f"Character ({name}): " + " | ".join(parts))
+    context = "\n".join(blocks)
+    return context, count_tokens(context)
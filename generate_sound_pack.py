@@ -1,33 +1,151 @@
-from ai_engine import AIEngine
+"""Headless batch runner for Production Sound Packs.
+
+Reads scene definitions from JSONL or CSV, generates sonic blueprints and ML labels concurrently
+through AIEngine, and checkpoints every finished scene to an append-only JSONL file. Re-running
+with the same output skips scenes that already completed, so an interrupted run resumes where it
+stopped. Successful scenes are also added to the ML label dataset (see label_dataset.py), whose
+normalized vocabulary and label index are shared with the app.
+
+    python generate_sound_pack.py --input scenes.jsonl --output sound_pack_results.jsonl --workers 6
+
+Each input record needs a `description` (or `prompt`) and may carry `id` and `title`. Records without
+an `id` are keyed by a hash of their title and description, so resuming never confuses two scenes
+that merely share a title.
+"""
 import os
+import csv
+import sys
+import json
+import time
+import hashlib
+import argparse
+from ai_engine import AIEngine
+from response_cache import ResponseCache
+from label_dataset import LabelDataset, DEFAULT_DATASET_DIR
+from telemetry import set_stage
+
+DEFAULT_SCENES = [
+    {"title": "Jungle Temple", "description": "Jungle temple environment with wind, insects, thunder, and footsteps. 10 seconds, realistic, cinematic, immersive."},
+    {"title": "Cyberpunk Street", "description": "Cyberpunk street at night with rain, footsteps, traffic, and one vehicle passing. 10 seconds, realistic, cinematic, immersive."},
+    {"title": "Emotional Mood", "description": "Mood sound: Emotional. Soft piano and wind. 10 seconds, studio quality, cinematic."},
+    {"title": "Horror Mood", "description": "Mood sound: Horror. Low bass and whisper. 10 seconds, studio quality, cinematic."},
+    {"title": "Action Mood", "description": "Mood sound: Action. Fast drums and explosion. 10 seconds, studio quality, cinematic."},
+    {"title": "Sci-fi Mood", "description": "Mood sound: Sci-fi. Futuristic synth and digital beeps. 10 seconds, studio quality, cinematic."}
+]
+
+
+def load_scenes(path):
+    """Loads scene dicts from a .jsonl or .csv file, filling in `id` and `title` when absent.
+
+    Records whose id repeats an earlier one are skipped with a warning.
+    """
+    if path is None:
+        rows = [dict(scene) for scene in DEFAULT_SCENES]
+    elif path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    scenes, seen = [], set()
+    for i, row in enumerate(rows, start=1):
+        description = row.get("description") or row.get("prompt")
+        if not description:
+            print(f"Skipping input record {i}: no description", file=sys.stderr)
+            continue
+        # Hashing the given title (not the "Scene {i}" fallback) keeps ids stable when rows move
+        content = f"{row.get('title') or ''}\x00{description}"
+        scene_id = str(row.get("id") or hashlib.sha256(content.encode("utf-8")).hexdigest()[:16])
+        title = row.get("title") or f"Scene {i}"
+        if scene_id in seen:
+            print(f"Skipping input record {i}: duplicate of scene {scene_id}", file=sys.stderr)
+            continue
+        seen.add(scene_id)
+        scenes.append({"id": scene_id, "title": title, "description": description})
+    return scenes
+
+
+def load_completed(path):
+    """Returns the ids already checkpointed successfully in an output file."""
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash mid-write can leave a torn final line; that scene is simply redone
+                continue
+            if not record.get("error"):
+                completed.add(record["id"])
+    return completed
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:d}:{minutes:02d}:{seconds:02d}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a Production Sound Pack in batch.")
+    parser.add_argument("--input", help="Scene definitions (.jsonl or .csv). Defaults to the built-in six scenes.")
+    parser.add_argument("--output", default="sound_pack_results.jsonl", help="Append-only JSONL checkpoint file.")
+    parser.add_argument("--workers", type=int, default=6, help="Scenes processed concurrently.")
+    parser.add_argument("--api-key", default=None, help="Groq API key (defaults to GROQ_API_KEY).")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the API instead of reusing cached responses.")
+    parser.add_argument("--cache", default=None, help="Response cache file (defaults to the one shared with the app).")
+    parser.add_argument("--no-semantic-cache", action="store_true", help="Do not index prompts for the app's near-duplicate reuse.")
+    parser.add_argument("--dataset", default=DEFAULT_DATASET_DIR, help="Sharded ML label dataset directory to append results to.")
+    parser.add_argument("--no-dataset", action="store_true", help="Only write the checkpoint file, not the label dataset.")
+    args = parser.parse_args(argv)
+
+    scenes = load_scenes(args.input)
+    completed = load_completed(args.output)
+    pending = [scene for scene in scenes if scene["id"] not in completed]
+    by_id = {scene["id"]: scene for scene in pending}
+    print(f"--- Sound Pack: {len(scenes)} scenes, {len(scenes) - len(pending)} already done, {len(pending)} to generate ---")
+    if not pending:
+        return 0
+
+    cache = False if args.no_cache else (ResponseCache(path=args.cache) if args.cache else None)
+    ai = AIEngine(api_key=args.api_key, cache=cache, semantic_cache=False if args.no_semantic_cache else None)
+    dataset = None if args.no_dataset else LabelDataset(args.dataset)
+    set_stage("Batch Sound Pack")
+    started = time.monotonic()
+    failures = 0
+    with open(args.output, "a", encoding="utf-8") as out:
+        results = ai.generate_sound_pack([(scene["id"], scene["description"]) for scene in pending], max_workers=args.workers)
+        for done, (scene_id, blueprint, labels) in enumerate(results, start=1):
+            scene = by_id[scene_id]
+            record = {"id": scene_id, "title": scene["title"], "description": scene["description"], "completed_at": time.time()}
+            if blueprint.startswith("Error"):
+                record["error"] = blueprint
+                failures += 1
+            else:
+                record["blueprint"] = blueprint
+                record["labels"] = labels
+            # Checkpoint before moving on so a crash never loses a finished scene
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            os.fsync(out.fileno())
+            if dataset and "error" not in record:
+                dataset.append(scene["title"], scene["description"], blueprint, labels, source="generate_sound_pack")
+
+            elapsed = time.monotonic() - started
+            rate = done / elapsed if elapsed else 0.0
+            eta = (len(pending) - done) / rate if rate else 0.0
+            status = "FAILED" if "error" in record else "ok"
+            print(f"[{done}/{len(pending)}] {scene['title']} ({status}) | {rate * 60:.1f} scenes/min | ETA {format_duration(eta)}")
+
+    print(f"--- Finished in {format_duration(time.monotonic() - started)}: {len(pending) - failures} ok, {failures} failed (re-run to retry) ---")
+    if dataset:
+        stats = dataset.stats()
+        print(f"--- Label dataset {args.dataset}: {stats['records']} records, {stats['labels']} labels, {stats['shards']} shards ---")
+    return 1 if failures else 0
+
 
-api_key = "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"
-ai = AIEngine(api_key=api_key)
-
-scenes = {
-    "Jungle Temple": "Jungle temple environment with wind, insects, thunder, and footsteps. 10 seconds, realistic, cinematic, immersive.",
-    "Cyberpunk Street": "Cyberpunk street at night with rain, footsteps, traffic, and one vehicle passing. 10 seconds, realistic, cinematic, immersive.",
-    "Emotional Mood": "Mood sound: Emotional. Soft piano and wind. 10 seconds, studio quality, cinematic.",
-    "Horror Mood": "Mood sound: Horror. Low bass and whisper. 10 seconds, studio quality, cinematic.",
-    "Action Mood": "Mood sound: Action. Fast drums and explosion. 10 seconds, studio quality, cinematic.",
-    "Sci-fi Mood": "Mood sound: Sci-fi. Futuristic synth and digital beeps. 10 seconds, studio quality, cinematic."
-}
-
-results = {}
-
-print("--- Generating Sound Design Pack ---")
-for name, Prompt in scenes.items():
-    print(f"Generating for {name}...")
-    blueprint = ai.generate_sound_design(Prompt)
-    results[name] = blueprint
-
-print("\n--- ML Dataset Labels ---")
-labels = ["Rain", "Footsteps", "Thunder", "Vehicle", "Wind", "Breathing", "Door Open"]
-print(f"Expected Labels: {', '.join(labels)}")
-
-# Write to a temporary file to be picked up by the agent
-with open("sound_pack_results.txt", "w", encoding="utf-8") as f:
-    for name, blueprint in results.items():
-        f.write(f"### {name}\n{blueprint}\n\n")
-    f.write("### ML Dataset Labels\n")
-    f.write(", ".join(labels))
+if __name__ == "__main__":
+    sys.exit(main())
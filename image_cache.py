@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from response_cache import DEFAULT_CACHE_DIR
+
+# clear() leaves younger *.tmp files alone: another process (a job worker) may still be writing them
+TMP_GRACE_SECONDS = 600
+
+_shared_image_cache = None
+_shared_image_cache_lock = threading.Lock()
+
+
+class ImageCache:
+    """On-disk LRU of generated images, stored as ready-to-serve JPEG thumbnails.
+
+    Entries are keyed by (prompt, size, seed), so a beat that was already rendered is served from
+    disk instead of being regenerated remotely. File access times drive eviction once the directory
+    exceeds `max_bytes`.
+    """
+
+    def __init__(self, path=None, max_bytes=200 * 1024 * 1024):
+        self.path = path or os.path.join(DEFAULT_CACHE_DIR, "images")
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        os.makedirs(self.path, exist_ok=True)
+        # Only finished images count; a *.tmp may still be in flight in another process
+        self._total_bytes = sum(
+            entry.stat().st_size for entry in os.scandir(self.path) if entry.is_file() and entry.name.endswith(".jpg")
+        )
+
+    @staticmethod
+    def make_key(prompt, width, height, seed):
+        payload = json.dumps([prompt, width, height, seed], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, f"{key}.jpg")
+
+    def get(self, key):
+        path = self._file(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # Bump the recency that eviction orders by
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self._counters["misses"] += 1
+            return None
+        with self._lock:
+            self._counters["hits"] += 1
+        return data
+
+    def set(self, key, data):
+        if not data:
+            return
+        path = self._file(key)
+        # Written under a unique temporary name (the app and job workers share the directory) so a
+        # concurrent reader never sees a partial image
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        with self._lock:
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            self._total_bytes += len(data) - previous
+            self._counters["writes"] += 1
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def clear(self):
+        cutoff = time.time() - TMP_GRACE_SECONDS
+        with self._lock:
+            for entry in os.scandir(self.path):
+                try:
+                    if entry.is_file() and (not entry.name.endswith(".tmp") or entry.stat().st_mtime < cutoff):
+                        os.remove(entry.path)
+                except OSError:
+                    continue  # renamed or removed by another process meanwhile
+            self._total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["bytes"] = self._total_bytes
+        return stats
+
+    def _evict(self):
+        entries = sorted(
+            (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+            for entry in os.scandir(self.path)
+            if entry.is_file() and entry.name.endswith(".jpg")
+        )
+        # Trim to 90% of the cap so eviction doesn't run on every subsequent write
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if self._total_bytes <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._total_bytes -= size
+            self._counters["evictions"] += 1
+
+
+def make_thumbnail(image_bytes, width, height, quality=85):
+    """Decodes an image, center-crops it to the target aspect ratio and re-encodes it as a small JPEG."""
+    import imageio.v3 as iio
+    from motion_synthesis import resize_frame
+
+    frame = iio.imread(image_bytes)
+    if frame.ndim == 2:
+        frame = frame[..., None].repeat(3, axis=-1)
+    frame = frame[..., :3]
+    src_h, src_w = frame.shape[:2]
+    # Crop before resizing so the thumbnail is never stretched
+    crop_w = min(src_w, round(src_h * width / height))
+    crop_h = min(src_h, round(src_w * height / width))
+    top, left = (src_h - crop_h) // 2, (src_w - crop_w) // 2
+    frame = resize_frame(frame[top:top + crop_h, left:left + crop_w], width, height)
+    return iio.imwrite("<bytes>", frame, extension=".jpg", quality=quality)
+
+
+def get_shared_image_cache():
+    """Returns the process-wide image cache shared by every engine instance."""
+    global _shared_image_cache
+    with _shared_image_cache_lock:
+        if _shared_image_cache is None:
+            _shared_image_cache = ImageCache()
+        return _shared_image_cache
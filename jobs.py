@@ -0,0 +1,314 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from response_cache import DEFAULT_CACHE_DIR
+
+ACTIVE_STATUSES = ("queued", "running", "cancelling")
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+# RPM/TPM balances shared by the app and every job worker (see request_scheduler.SharedTokenBucket)
+QUOTA_PATH = os.path.join(DEFAULT_CACHE_DIR, "quota.sqlite")
+# Finished jobs (and their progress events) are forgotten after this long
+JOB_HISTORY_SECONDS = 7 * 24 * 3600
+
+CLIP_STEP_LABELS = {
+    "prompt": "Cinematic Prompt",
+    "specs": "Motion Vectors & Camera Paths",
+    "script": "10-Second Automation Script",
+    "storyboard": "10-Second Production Blueprint",
+    "labels": "Sound Blueprint & Soundtrack Labels"
+}
+
+# Per worker process: engines by API-key hash, reused across jobs with their connection pools
+_worker_engines = {}
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _connect(path):
+    db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    return db
+
+
+class JobQueue:
+    """Runs long renders in a pool of worker processes and tracks them in a SQLite job table.
+
+    A Clip Studio render or Sound Pack neither blocks the Streamlit script thread nor dies with the
+    browser tab: state, progress events and results are persisted under a job id the UI can poll or
+    reattach to. The API key travels to the worker in memory and is never written to the database,
+    so jobs still queued when the server stops are marked as interrupted on the next start.
+    """
+
+    def __init__(self, path=None, max_workers=DEFAULT_WORKERS):
+        self.path = path or os.path.join(DEFAULT_CACHE_DIR, "jobs.sqlite")
+        self.max_workers = max_workers
+        self._pool = None
+        self._futures = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._db = _connect(self.path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, params TEXT NOT NULL, key_hash TEXT NOT NULL, "
+            "status TEXT NOT NULL, progress REAL NOT NULL DEFAULT 0, message TEXT, result TEXT, error TEXT, "
+            "owner_pid INTEGER, worker_pid INTEGER, created REAL NOT NULL, started REAL, finished REAL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS job_events ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT NOT NULL, ts REAL NOT NULL, progress REAL, message TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS job_events_job ON job_events (job_id, id)")
+        self._recover()
+
+    def _recover(self):
+        now = time.time()
+        with self._lock:
+            # Jobs owned by a previous server process lost their in-memory API key and worker
+            self._db.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Interrupted by a server restart; please resubmit.', finished = ? "
+                "WHERE status IN ('queued', 'running', 'cancelling') AND owner_pid != ?",
+                (now, os.getpid())
+            )
+            self._db.execute(
+                "DELETE FROM job_events WHERE job_id IN (SELECT id FROM jobs WHERE finished < ?)",
+                (now - JOB_HISTORY_SECONDS,)
+            )
+            self._db.execute("DELETE FROM jobs WHERE finished < ?", (now - JOB_HISTORY_SECONDS,))
+            self._db.commit()
+
+    def _executor(self):
+        if self._pool is None:
+            # spawn, not fork: the Streamlit server is multi-threaded and forking it is unsafe
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=get_context("spawn"))
+        return self._pool
+
+    def _discard_pool(self, pool):
+        """Drops a pool a dead worker has broken, so the next submit starts a fresh one. Needs self._lock."""
+        if self._pool is pool:
+            self._pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, kind, params, api_key):
+        """Queues a job and returns its id. `params` must be JSON-serializable."""
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = uuid.uuid4().hex
+        args = (_run_job, self.path, job_id, kind, params, api_key)
+        with self._lock:
+            # The row exists before the worker can look for it
+            self._db.execute(
+                "INSERT INTO jobs (id, kind, params, key_hash, status, message, owner_pid, created) "
+                "VALUES (?, ?, ?, ?, 'queued', 'Waiting for a worker...', ?, ?)",
+                (job_id, kind, json.dumps(params), _key_hash(api_key), os.getpid(), time.time())
+            )
+            self._db.commit()
+            try:
+                pool = self._executor()
+                try:
+                    future = pool.submit(*args)
+                except BrokenProcessPool:
+                    # A worker died since the last submit and its crash callback has not run yet
+                    self._discard_pool(pool)
+                    pool = self._executor()
+                    future = pool.submit(*args)
+            except Exception as e:
+                self._db.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, finished = ? WHERE id = ?",
+                    (f"Error: {str(e)}", time.time(), job_id)
+                )
+                self._db.commit()
+                raise
+            self._futures[job_id] = future
+        future.add_done_callback(lambda f: self._on_worker_exit(job_id, f, pool))
+        return job_id
+
+    def _on_worker_exit(self, job_id, future, pool):
+        with self._lock:
+            self._futures.pop(job_id, None)
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            if isinstance(error, BrokenProcessPool):
+                with self._lock:
+                    self._discard_pool(pool)
+            # The worker process itself died (e.g. out of memory); _run_job never got to record it
+            self._finish(job_id, "failed", error=f"Worker crashed: {error}")
+
+    def _finish(self, job_id, status, error=None):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished = ? WHERE id = ? AND status IN ('queued', 'running', 'cancelling')",
+                (status, error, time.time(), job_id)
+            )
+            self._db.commit()
+
+    def get(self, job_id):
+        """Returns the job as a dict (params and result decoded), or None if it is unknown."""
+        with self._lock:
+            cursor = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            row = cursor.fetchone()
+            columns = [c[0] for c in cursor.description]
+        if row is None:
+            return None
+        job = dict(zip(columns, row))
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def events(self, job_id, after=0):
+        """Progress events [(event_id, ts, progress, message)] newer than event id `after`."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT id, ts, progress, message FROM job_events WHERE job_id = ? AND id > ? ORDER BY id",
+                (job_id, after)
+            ).fetchall()
+
+    def cancel(self, job_id):
+        """Cancels a queued job outright; a running one stops at its next progress report."""
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None and future.cancel():
+            self._finish(job_id, "cancelled")
+            return
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'cancelling' WHERE id = ? AND status = 'running'", (job_id,)
+            )
+            self._db.commit()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _key_hash(api_key):
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+
+def quota_limits():
+    """RequestScheduler arguments under which the app and every job worker draw on one quota per key.
+
+    Any single process can use the whole quota, so a lone job or long-form screenplay runs at full
+    speed, while together they never exceed it.
+    """
+    return {"quota_path": QUOTA_PATH}
+
+
+def _worker_engine(api_key):
+    """Returns this worker's engine for an API key, building it (and its pools) on first use."""
+    from ai_engine import AIEngine
+    from request_scheduler import get_scheduler
+
+    key_hash = _key_hash(api_key)
+    if key_hash not in _worker_engines:
+        scheduler = get_scheduler(api_key, **quota_limits())
+        _worker_engines[key_hash] = AIEngine(api_key=api_key, scheduler=scheduler)
+    return _worker_engines[key_hash]
+
+
+def _run_job(db_path, job_id, kind, params, api_key):
+    """Worker-process entry point: runs one job and records its outcome."""
+    from telemetry import set_stage
+
+    db = _connect(db_path)
+    cursor = db.execute(
+        "UPDATE jobs SET status = 'running', worker_pid = ?, started = ?, message = 'Starting...' "
+        "WHERE id = ? AND status = 'queued'",
+        (os.getpid(), time.time(), job_id)
+    )
+    db.commit()
+    if cursor.rowcount == 0:
+        return  # cancelled while it waited
+
+    progress = {"value": 0.0}
+
+    def report(value=None, message=None):
+        if value is not None:
+            progress["value"] = value
+        db.execute(
+            "INSERT INTO job_events (job_id, ts, progress, message) VALUES (?, ?, ?, ?)",
+            (job_id, time.time(), progress["value"], message)
+        )
+        status = db.execute(
+            "UPDATE jobs SET progress = ?, message = COALESCE(?, message) WHERE id = ? RETURNING status",
+            (progress["value"], message, job_id)
+        ).fetchone()
+        db.commit()
+        if status and status[0] == "cancelling":
+            raise JobCancelled()
+
+    set_stage(f"Job: {kind}")
+    try:
+        result = JOB_HANDLERS[kind](_worker_engine(api_key), params, report)
+        db.execute(
+            "UPDATE jobs SET status = 'done', progress = 1, message = 'Complete', result = ?, finished = ? WHERE id = ?",
+            (json.dumps(result), time.time(), job_id)
+        )
+    except JobCancelled:
+        db.execute("UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ?", (time.time(), job_id))
+    except Exception as e:
+        db.execute(
+            "UPDATE jobs SET status = 'failed', error = ?, finished = ? WHERE id = ?",
+            (f"Error: {str(e)}", time.time(), job_id)
+        )
+    db.commit()
+    db.close()
+
+
+def _run_clip_render(engine, params, report):
+    idea = params["idea"]
+    report(0.02, "Architecting Prompt, Camera Paths, Motion Script & Storyboard in parallel...")
+
+    def on_step_done(key, result, done, total):
+        report(0.05 + 0.35 * done / total, f"Step {done}/{total}: {CLIP_STEP_LABELS[key]} ready...")
+
+    steps = {
+        "prompt": (engine.generate_video_prompt, (idea,)),
+        "specs": (engine.get_video_production_data, (idea,)),
+        "script": (engine.generate_motion_script, (idea,)),
+        "storyboard": (engine.generate_multi_frame_storyboard, (idea,))
+    }
+    if params.get("soundtrack"):
+        # Labels are tagged on a sound-design blueprint of the idea, as in the Sonic Soundscape Studio
+        steps["labels"] = (lambda text: engine.generate_sound_blueprint(text)[1], (idea,))
+    result = engine.run_concurrent(steps, progress_callback=on_step_done)
+
+    soundtrack = None
+    if "labels" in result:
+        labels = result.pop("labels")
+        # Without labels (a failed blueprint) the audio engine matches sound keywords in the idea itself
+        soundtrack = labels if isinstance(labels, list) and labels else [idea]
+
+    report(0.4, f"Rendering {params['width']}x{params['height']} @ {params['fps']} fps...")
+    video_path, video_error = engine.generate_ai_video(
+        idea, status_callback=lambda message: report(None, message),
+        width=params["width"], height=params["height"], fps=params["fps"], soundtrack=soundtrack
+    )
+    result.update(video_path=video_path, video_error=video_error, soundtrack=soundtrack)
+    return result
+
+
+def _run_sound_pack(engine, params, report):
+    scenes = params["scenes"]
+    results = []
+    report(0.0, f"Orchestrating {len(scenes)} scenes in parallel...")
+    for done, (title, blueprint, labels) in enumerate(engine.generate_sound_pack(scenes), start=1):
+        results.append({"title": title, "blueprint": blueprint, "labels": labels})
+        report(done / len(scenes), f"{done}/{len(scenes)}: {title} ready")
+    return results
+
+
+JOB_HANDLERS = {
+    "clip_render": _run_clip_render,
+    "sound_pack": _run_sound_pack
+}
@@ -0,0 +1,274 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from response_cache import DEFAULT_CACHE_DIR
+
+DEFAULT_DATASET_DIR = os.path.join(DEFAULT_CACHE_DIR, "label_dataset")
+# A shard is closed once the next record would take it past this size; closed shards are never rewritten
+DEFAULT_SHARD_BYTES = 16 * 1024 * 1024
+# Longer "labels" are sentences the model slipped into the list, not audio events
+MAX_LABEL_WORDS = 6
+
+# Spelling and inflection variants, folded word by word before the phrase table is applied
+WORD_SYNONYMS = {
+    "footstep": "footsteps", "rainfall": "rain", "raindrop": "raindrops", "thunderclap": "thunder",
+    "thunderclaps": "thunder", "bird": "birds", "birdsong": "birds", "insect": "insects", "cricket": "crickets",
+    "whispers": "whisper", "whispering": "whisper", "explosions": "explosion", "beep": "beeps",
+    "cars": "car", "automobile": "car", "vehicles": "vehicle", "sirens": "siren", "drum": "drums",
+    "synthesizer": "synth", "synths": "synth", "heartbeats": "heartbeat", "gunshots": "gunshot",
+    "doors": "door", "creaking": "creak", "creaks": "creak", "wave": "waves", "grey": "gray"
+}
+# Whole-label synonyms: different phrasings of the same audio event
+LABEL_SYNONYMS = {
+    "foot steps": "footsteps",
+    "rain fall": "rain",
+    "birds chirping": "birds",
+    "chirping birds": "birds",
+    "thunder rumble": "thunder",
+    "rumbling thunder": "thunder",
+    "crickets chirping": "crickets",
+    "car passing": "passing car",
+    "vehicle passing": "passing vehicle",
+    "heavy downpour": "heavy rain",
+    "downpour": "heavy rain"
+}
+_SMALL_WORDS = frozenset("a an and at by for from in of on or the to with".split())
+
+_LIST_MARKER = re.compile(r"^\s*(?:[-*+•]+|\d+[.)]|tag:|label:)\s*", re.IGNORECASE)
+_NOT_WORD = re.compile(r"[^a-z0-9' ]+")
+_SPLIT = re.compile(r"[,;\n|]+")
+
+
+def normalize_label(text):
+    """Returns the vocabulary key of a label (lowercase, folded synonyms), or "" if it is not a label."""
+    text = unicodedata.normalize("NFKC", text).strip().strip("\"'`").strip()
+    text = _LIST_MARKER.sub("", text).lower().replace("&", " and ")
+    words = _NOT_WORD.sub(" ", text.replace("-", " ").replace("_", " ")).split()
+    # "wind, insects, and thunder" leaves a dangling conjunction on the last item
+    while words and words[0] in ("and", "or"):
+        words.pop(0)
+    if not words or len(words) > MAX_LABEL_WORDS:
+        return ""
+    key = " ".join(WORD_SYNONYMS.get(w.strip("'"), w.strip("'")) for w in words)
+    return LABEL_SYNONYMS.get(key, key)
+
+
+def display_label(key):
+    """Title-cases a vocabulary key for display: "footsteps on gravel" -> "Footsteps on Gravel"."""
+    words = key.split()
+    return " ".join(w if i and w in _SMALL_WORDS else w[:1].upper() + w[1:] for i, w in enumerate(words))
+
+
+def parse_labels(raw):
+    """Turns a model's labels (a comma/newline-separated string or a list) into deduplicated display labels."""
+    if isinstance(raw, str):
+        raw = _SPLIT.split(raw)
+    labels, seen = [], set()
+    for item in raw or []:
+        key = normalize_label(item) if isinstance(item, str) else ""
+        if key and key not in seen:
+            seen.add(key)
+            labels.append(display_label(key))
+    return labels
+
+
+def record_id(description, blueprint):
+    """Content id of a record; appending the same scene and blueprint twice stores it once."""
+    return hashlib.sha256(f"{description}\x00{blueprint}".encode("utf-8")).hexdigest()[:16]
+
+
+class LabelDataset:
+    """Append-only ML audio-label dataset: scene/blueprint/label records in size-capped JSONL shards.
+
+    Shards are only ever appended to; when one reaches `shard_bytes` a new one is started. Beside
+    them, an SQLite index holds the label vocabulary (normalized key, display form, record count),
+    each record's shard and byte range, and an inverted label -> record postings table, so a lookup
+    reads just the matching lines. Appends run inside an immediate SQLite transaction, which also
+    serializes shard writes between processes (the app and the batch CLI can share a dataset).
+    """
+
+    def __init__(self, path=None, shard_bytes=DEFAULT_SHARD_BYTES):
+        self.path = path or DEFAULT_DATASET_DIR
+        self.shard_bytes = shard_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(self.path, "index.sqlite"), timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS labels ("
+            "id INTEGER PRIMARY KEY, key TEXT UNIQUE NOT NULL, display TEXT NOT NULL, count INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            "id TEXT PRIMARY KEY, shard INTEGER NOT NULL, offset INTEGER NOT NULL, length INTEGER NOT NULL, created REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS postings ("
+            "label_id INTEGER NOT NULL, record_id TEXT NOT NULL, PRIMARY KEY (label_id, record_id)) WITHOUT ROWID"
+        )
+        self._recover()
+
+    def _shard_path(self, shard):
+        return os.path.join(self.path, f"labels-{shard:05d}.jsonl")
+
+    def _current_shard(self):
+        shard = self._db.execute("SELECT COALESCE(MAX(shard), 0) FROM records").fetchone()[0]
+        # Another process (or a torn write) may have started a newer shard
+        while os.path.exists(self._shard_path(shard + 1)):
+            shard += 1
+        return shard
+
+    def _recover(self):
+        """Indexes complete lines written to the newest shard by a process that died before committing."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                shard = self._current_shard()
+                path = self._shard_path(shard)
+                end = self._db.execute(
+                    "SELECT COALESCE(MAX(offset + length), 0) FROM records WHERE shard = ?", (shard,)
+                ).fetchone()[0]
+                if os.path.exists(path) and os.path.getsize(path) > end:
+                    with open(path, "rb") as f:
+                        f.seek(end)
+                        offset = end
+                        for line in f:
+                            if not line.endswith(b"\n"):
+                                break  # torn final line: the next append starts a fresh shard
+                            try:
+                                record = json.loads(line)
+                            except json.JSONDecodeError:
+                                record = None
+                            if isinstance(record, dict) and record.get("id"):
+                                self._index(record, shard, offset, len(line))
+                            offset += len(line)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _index(self, record, shard, offset, length):
+        cursor = self._db.execute(
+            "INSERT OR IGNORE INTO records (id, shard, offset, length, created) VALUES (?, ?, ?, ?, ?)",
+            (record["id"], shard, offset, length, record.get("created", time.time()))
+        )
+        if cursor.rowcount == 0:
+            return
+        for label in record.get("labels", []):
+            key = normalize_label(label)
+            if not key:
+                continue
+            label_id = self._db.execute(
+                "INSERT INTO labels (key, display, count) VALUES (?, ?, 1) "
+                "ON CONFLICT(key) DO UPDATE SET count = count + 1 RETURNING id",
+                (key, display_label(key))
+            ).fetchone()[0]
+            self._db.execute("INSERT OR IGNORE INTO postings (label_id, record_id) VALUES (?, ?)", (label_id, record["id"]))
+
+    def extend(self, records):
+        """Appends records (dicts with title, description, blueprint, labels and any extra fields) and
+        returns their ids. Labels are normalized; records already in the dataset are skipped."""
+        ids = []
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                shard = self._current_shard()
+                f = open(self._shard_path(shard), "ab+")
+                try:
+                    for record in records:
+                        record = dict(record)
+                        record["labels"] = parse_labels(record.get("labels"))
+                        record.setdefault("id", record_id(record.get("description", ""), record.get("blueprint", "")))
+                        record.setdefault("created", time.time())
+                        ids.append(record["id"])
+                        if self._db.execute("SELECT 1 FROM records WHERE id = ?", (record["id"],)).fetchone():
+                            continue
+                        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+                        offset = f.seek(0, os.SEEK_END)
+                        torn = False
+                        if offset:
+                            f.seek(-1, os.SEEK_END)
+                            torn = f.read(1) != b"\n"
+                        if torn or (offset and offset + len(line) > self.shard_bytes):
+                            f.close()
+                            shard += 1
+                            f = open(self._shard_path(shard), "ab+")
+                            offset = 0
+                        f.write(line)
+                        self._index(record, shard, offset, len(line))
+                    f.flush()
+                finally:
+                    f.close()
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return ids
+
+    def append(self, title, description, blueprint, labels, **extra):
+        """Appends one record and returns its id (the existing id if it is already stored)."""
+        return self.extend([dict(extra, title=title, description=description, blueprint=blueprint, labels=labels)])[0]
+
+    def lookup(self, label):
+        """Ids of the records tagged with a label (any spelling that normalizes to it), oldest first."""
+        with self._lock:
+            return [row[0] for row in self._db.execute(
+                "SELECT p.record_id FROM labels l JOIN postings p ON p.label_id = l.id "
+                "JOIN records r ON r.id = p.record_id WHERE l.key = ? ORDER BY r.created",
+                (normalize_label(label),)
+            )]
+
+    def query(self, all_of=(), any_of=()):
+        """Ids of records carrying every label in `all_of` and, if given, at least one in `any_of`."""
+        matches = None
+        for label in all_of:
+            ids = set(self.lookup(label))
+            matches = ids if matches is None else matches & ids
+        if any_of:
+            ids = set().union(*(self.lookup(label) for label in any_of))
+            matches = ids if matches is None else matches & ids
+        return sorted(matches or ())
+
+    def records(self, ids=None):
+        """Yields stored records (all of them, in append order, when `ids` is None)."""
+        with self._lock:
+            if ids is None:
+                rows = self._db.execute("SELECT shard, offset, length FROM records ORDER BY shard, offset").fetchall()
+            else:
+                placeholders = ",".join("?" * len(ids))
+                rows = self._db.execute(
+                    f"SELECT shard, offset, length FROM records WHERE id IN ({placeholders}) ORDER BY shard, offset", list(ids)
+                ).fetchall() if ids else []
+        f, open_shard = None, None
+        try:
+            for shard, offset, length in rows:
+                if shard != open_shard:
+                    if f:
+                        f.close()
+                    f, open_shard = open(self._shard_path(shard), "rb"), shard
+                f.seek(offset)
+                yield json.loads(f.read(length))
+        finally:
+            if f:
+                f.close()
+
+    def vocabulary(self, limit=None):
+        """[(display_label, record_count)], most frequent first."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT display, count FROM labels ORDER BY count DESC, key LIMIT ?", (limit or -1,)
+            ).fetchall()
+
+    def stats(self):
+        with self._lock:
+            records, shards = self._db.execute("SELECT COUNT(*), COUNT(DISTINCT shard) FROM records").fetchone()
+            labels = self._db.execute("SELECT COUNT(*) FROM labels").fetchone()[0]
+        return {"records": records, "labels": labels, "shards": shards}
+
+    def close(self):
+        self._db.close()
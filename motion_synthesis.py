@@ -0,0 +1,128 @@
+import numpy as np
+
+# Peak bytes of output frames held in memory at once while rendering
+CHUNK_BYTES = 256 * 1024 * 1024
+
+
+def resize_frame(frame, width, height):
+    """Bilinearly resizes an (H, W, 3) uint8 frame."""
+    return np.ascontiguousarray(_unpack_rgb(_resize_packed(_pack_rgba(frame), width, height)))
+
+
+def _pack_rgba(frame):
+    """Views an RGB frame as one uint32 per pixel so each gather moves a whole pixel."""
+    if frame.ndim == 2:
+        frame = frame[..., None]
+    rgba = np.empty(frame.shape[:2] + (4,), dtype=np.uint8)
+    rgba[..., :3] = frame[..., :3]
+    rgba[..., 3] = 255
+    return rgba.view(np.uint32)[..., 0]
+
+
+def _unpack_rgb(packed):
+    return packed[..., None].view(np.uint8)[..., :3]
+
+
+def _lerp_packed(current, incoming, weight, out, scratch):
+    """Blends packed RGBA pixels toward `incoming` by weight/256, two 8-bit channels per multiply.
+
+    `weight` is a uint32 scalar or array broadcastable against the pixels; `out` may alias `current`.
+    """
+    mask = np.uint32(0x00FF00FF)
+    inverse = np.uint32(256) - weight
+    red_blue, green_alpha, tmp = scratch
+    # Red/blue sit in the low byte of each 16-bit half; green/alpha are shifted down into them
+    np.bitwise_and(current, mask, out=red_blue)
+    red_blue *= inverse
+    np.bitwise_and(incoming, mask, out=tmp)
+    tmp *= weight
+    red_blue += tmp
+    red_blue >>= 8
+    red_blue &= mask
+    np.right_shift(current, 8, out=green_alpha)
+    green_alpha &= mask
+    green_alpha *= inverse
+    np.right_shift(incoming, 8, out=tmp)
+    tmp &= mask
+    tmp *= weight
+    green_alpha += tmp
+    green_alpha &= ~mask
+    np.bitwise_or(red_blue, green_alpha, out=out)
+
+
+def _resize_packed(packed, width, height):
+    src_h, src_w = packed.shape
+    ys = np.clip((np.arange(height) + 0.5) * (src_h / height) - 0.5, 0, src_h - 1)
+    xs = np.clip((np.arange(width) + 0.5) * (src_w / width) - 0.5, 0, src_w - 1)
+    y0, x0 = ys.astype(np.intp), xs.astype(np.intp)
+    y1, x1 = np.minimum(y0 + 1, src_h - 1), np.minimum(x0 + 1, src_w - 1)
+    wy = ((ys - y0) * 256).astype(np.uint32)[:, None]
+    wx = ((xs - x0) * 256).astype(np.uint32)[None, :]
+
+    rows = packed.take(y0, axis=0)
+    _lerp_packed(rows, packed.take(y1, axis=0), wy, rows, [np.empty_like(rows) for _ in range(3)])
+    out = rows.take(x0, axis=1)
+    _lerp_packed(out, rows.take(x1, axis=1), wx, out, [np.empty_like(out) for _ in range(3)])
+    return out
+
+
+def render_motion(keyframes, width, height, fps, duration, zoom=0.12, transition=0.6):
+    """Synthesizes Ken Burns pan/zoom motion with crossfades between keyframes.
+
+    Yields (N, height, width, 4) uint8 RGBA batches in playback order. Batches are sized so at
+    most CHUNK_BYTES of output is alive at once, which keeps 4K renders bounded in memory. The
+    batch buffer is reused, so each batch must be consumed before the next one is requested.
+    """
+    if not keyframes:
+        return
+    canvas_w, canvas_h = int(width * (1 + zoom)), int(height * (1 + zoom))
+    canvases = [_resize_packed(_pack_rgba(kf), canvas_w, canvas_h) for kf in keyframes]
+
+    total_frames = max(1, int(round(duration * fps)))
+    segment = duration / len(keyframes)
+    transition = min(transition, segment / 2)
+    chunk_size = min(total_frames, max(1, CHUNK_BYTES // (width * height * 4)))
+    rows = np.arange(height, dtype=np.float32)
+    cols = np.arange(width, dtype=np.float32)
+
+    # Large buffers are allocated once; fresh multi-megabyte arrays per frame cost more in page
+    # faults than the pixel math itself
+    batch = np.empty((chunk_size, height, width), dtype=np.uint32)
+    incoming = np.empty((height, width), dtype=np.uint32)
+    blend_scratch = [np.empty((height, width), dtype=np.uint32) for _ in range(3)]
+
+    def window(k, t):
+        # Alternate zoom-in/zoom-out and pan direction per keyframe so motion reads as continuous
+        progress = np.clip((t - k * segment) / (segment + transition), 0, 1)
+        scale = 1 + zoom * (progress if k % 2 == 0 else 1 - progress)
+        win_h, win_w = canvas_h / scale, canvas_w / scale
+        pan = progress if (k // 2) % 2 == 0 else 1 - progress
+        y0 = (canvas_h - win_h) / 2
+        x0 = (canvas_w - win_w) * pan
+        ys = np.minimum((y0[:, None] + rows[None, :] * (win_h / height)[:, None]).astype(np.intp), canvas_h - 1)
+        xs = np.minimum((x0[:, None] + cols[None, :] * (win_w / width)[:, None]).astype(np.intp), canvas_w - 1)
+        return ys, xs
+
+    def sample(canvas, ys, xs, out):
+        # Whole-row copies first, then the per-pixel column gather straight into the output
+        np.take(canvas[ys], xs, axis=1, out=out)
+
+    for start in range(0, total_frames, chunk_size):
+        t = np.arange(start, min(start + chunk_size, total_frames), dtype=np.float32) / fps
+        k = np.minimum((t // segment).astype(np.intp), len(keyframes) - 1)
+        # Frames inside the last `transition` seconds of a segment blend into the next keyframe
+        alpha = np.clip((t - (k + 1) * segment + transition) / transition, 0, 1)
+        alpha[k == len(keyframes) - 1] = 0
+        weights = (alpha * 256).astype(np.uint32)
+
+        for kf in np.unique(k):
+            idx = np.nonzero(k == kf)[0]
+            ys, xs = window(kf, t[idx])
+            next_ys, next_xs = window(kf + 1, t[idx]) if kf + 1 < len(keyframes) else (None, None)
+            for j, i in enumerate(idx):
+                sample(canvases[kf], ys[j], xs[j], batch[i])
+                if weights[i]:
+                    sample(canvases[kf + 1], next_ys[j], next_xs[j], incoming)
+                    _lerp_packed(batch[i], incoming, weights[i], batch[i], blend_scratch)
+
+        yield batch[:len(t)].view(np.uint8).reshape(len(t), height, width, 4)
@@ -0,0 +1,280 @@
+import re
+import time
+import hashlib
+from reportlab.lib.pagesizes import LETTER
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+from reportlab import rl_config
+
+# Industry screenplay layout on US Letter (points from the left edge), 12pt Courier at 6 lines per inch
+SCRIPT_FONT = ("Courier", 12, 12)
+SCRIPT_COLUMNS = {
+    "heading": (108, 432),
+    "action": (108, 432),
+    "character": (266, 240),
+    "parenthetical": (223, 166),
+    "dialogue": (180, 252),
+    "transition": (108, 432)
+}
+PROSE_FONTS = {
+    "body": ("Helvetica", 10.5, 14),
+    "heading": ("Helvetica-Bold", 13, 18),
+    "section": ("Helvetica-Bold", 20, 26)
+}
+MARGIN = 72
+BOOK_FONTS = ("Helvetica", "Helvetica-Bold", "Courier", "Courier-Bold")
+
+# Page streams are already Flate-compressed; ASCII85 on top only adds size and pure-Python encode time
+rl_config.useA85 = 0
+
+_SCENE_HEADING = re.compile(r"^(INT|EXT|EST|INT\./EXT|INT/EXT|I/E)[\.\s]")
+_MARKDOWN_EMPHASIS = re.compile(r"\*\*|__|`")
+_PUNCTUATION = str.maketrans({"‘": "'", "’": "'", "“": '"', "”": '"', "–": "-", "—": "--", "…": "..."})
+
+
+def _sanitize(text):
+    # The built-in PDF fonts only cover Windows-1252; anything else would render as a missing glyph
+    return text.translate(_PUNCTUATION).encode("cp1252", "replace").decode("cp1252")
+
+
+def is_screenplay(text):
+    """True when the text reads as a screenplay (it has at least one INT./EXT. scene heading)."""
+    return any(_SCENE_HEADING.match(_MARKDOWN_EMPHASIS.sub("", line).strip().upper()) for line in text.splitlines())
+
+
+def _wrap(text, font, size, width):
+    """Greedy word wrap using the font's real glyph widths."""
+    words = text.split()
+    if not words:
+        return [""]
+    space = stringWidth(" ", font, size)
+    lines, current, current_width = [], [], 0.0
+    for word in words:
+        word_width = stringWidth(word, font, size)
+        if current and current_width + space + word_width > width:
+            lines.append(" ".join(current))
+            current, current_width = [word], word_width
+        else:
+            current_width += (space if current else 0.0) + word_width
+            current.append(word)
+    lines.append(" ".join(current))
+    return lines
+
+
+def _script_blocks(text):
+    """Classifies screenplay lines into (element, text) blocks, with None marking a blank line."""
+    blocks = []
+    in_dialogue = False
+    for raw in text.splitlines():
+        line = _MARKDOWN_EMPHASIS.sub("", raw).strip()
+        if not line:
+            blocks.append((None, ""))
+            in_dialogue = False
+        elif _SCENE_HEADING.match(line.upper()):
+            blocks.append(("heading", line.upper()))
+            in_dialogue = False
+        elif line.isupper() and line.rstrip().endswith("TO:"):
+            blocks.append(("transition", line))
+            in_dialogue = False
+        elif in_dialogue and line.startswith("(") and line.endswith(")"):
+            blocks.append(("parenthetical", line))
+        elif in_dialogue:
+            blocks.append(("dialogue", line))
+        elif line.isupper() and len(line) <= 40 and not line.endswith((".", "!", "?", ":")):
+            blocks.append(("character", line))
+            in_dialogue = True
+        else:
+            blocks.append(("action", line))
+    return blocks
+
+
+def _prose_blocks(text):
+    """Classifies markdown-ish plan text into (style, indent, text) blocks, with None marking a blank line."""
+    blocks = []
+    for raw in text.splitlines():
+        line = _MARKDOWN_EMPHASIS.sub("", raw).strip()
+        if not line:
+            blocks.append((None, 0, ""))
+        elif line.startswith("#"):
+            blocks.append(("heading", 0, line.lstrip("#").strip()))
+        elif re.match(r"^([-*+•]|\d+[.)])\s+", line):
+            marker, _, rest = line.partition(" ")
+            blocks.append(("body", 14, f"{'•' if marker in '-*+•' else marker} {rest.strip()}"))
+        else:
+            blocks.append(("body", 0, line))
+    return blocks
+
+
+class PdfBookRenderer:
+    """Renders the Master Production Book to PDF by drawing straight onto a reportlab canvas.
+
+    Each section starts on a new page, so its layout (line wrapping, page breaks) and its encoded
+    page streams do not depend on its neighbours and are cached by title and a hash of the content.
+    A re-export only lays out and encodes sections whose text changed; everything else is replayed
+    verbatim. Page numbers for the table of contents come from a first pass over the cached layouts.
+    Memory still grows with the book: the canvas holds every page until save() writes the file.
+    """
+
+    def __init__(self, pagesize=LETTER):
+        self.pagesize = pagesize
+        self._layouts = {}
+        self._page_code = {}
+        self.stats = {"layouts": 0, "reused": 0}
+
+    def _paginate(self, lines):
+        """Splits (font, size, leading, x, text) lines into pages of (font, size, x, y, text) draw ops."""
+        page_width, page_height = self.pagesize
+        bottom = MARGIN
+        pages, page = [], []
+        y = page_height - MARGIN
+        for font, size, leading, x, text in lines:
+            if y - leading < bottom:
+                pages.append(page)
+                page, y = [], page_height - MARGIN
+                if text == "":
+                    continue  # blank spacing lines are dropped at the top of a page
+            y -= leading
+            if text:
+                page.append((font, size, x, y, text))
+        pages.append(page)
+        return pages
+
+    def _layout_section(self, title, content):
+        page_width = self.pagesize[0]
+        name, size, leading = PROSE_FONTS["section"]
+        lines = [(name, size, leading, MARGIN, line) for line in _wrap(_sanitize(title), name, size, page_width - 2 * MARGIN)]
+        lines.append((name, size, leading, MARGIN, ""))
+        content = _sanitize(content)
+
+        if is_screenplay(content):
+            font, size, leading = SCRIPT_FONT
+            for element, text in _script_blocks(content):
+                if element is None:
+                    lines.append((font, size, leading, MARGIN, ""))
+                    continue
+                x, width = SCRIPT_COLUMNS[element]
+                bold = "Courier-Bold" if element == "heading" else font
+                for line in _wrap(text, bold, size, width):
+                    if element == "transition":
+                        x = SCRIPT_COLUMNS["action"][0] + width - stringWidth(line, bold, size)
+                    lines.append((bold, size, leading, x, line))
+        else:
+            for style, indent, text in _prose_blocks(content):
+                font, size, leading = PROSE_FONTS[style or "body"]
+                if style is None:
+                    lines.append((font, size, leading / 2, MARGIN, ""))
+                    continue
+                first = True
+                for line in _wrap(text, font, size, page_width - 2 * MARGIN - indent):
+                    # Bulleted items hang their continuation lines under the text, not the bullet
+                    x = MARGIN + (indent - 10 if indent and first else indent)
+                    lines.append((font, size, leading, x, line))
+                    first = False
+        return self._paginate(lines)
+
+    def layout(self, title, content):
+        """Returns the cached page layout of one section, laying it out only if its content changed."""
+        # Keyed by content, not by artifact version: versions restart per project and after a delete
+        key = (title, hashlib.sha256(content.encode("utf-8")).hexdigest())
+        if key in self._layouts:
+            self.stats["reused"] += 1
+        else:
+            self._layouts[key] = self._layout_section(title, content)
+            self.stats["layouts"] += 1
+        return key, self._layouts[key]
+
+    def render(self, sections, output, book_title="Master Production Book", subtitle=""):
+        """Writes the book as PDF to `output` (a path or binary file object).
+
+        `sections` is an iterable of (title, content) pairs. Returns the number of pages written.
+        """
+        laid_out = [self.layout(title, content) for title, content in sections]
+        # Forget layouts of sections that are no longer in the book so the cache stays bounded
+        live = {key for key, _ in laid_out}
+        for key in list(self._layouts):
+            if key not in live:
+                del self._layouts[key]
+                self._page_code.pop(key, None)
+
+        page_width, page_height = self.pagesize
+        toc_font, toc_size, toc_leading = PROSE_FONTS["body"]
+        toc_per_page = int((page_height - 2 * MARGIN - 40) // toc_leading)
+        toc_pages = max(1, -(-len(laid_out) // toc_per_page))
+        # First pass: page numbers from the cached layouts (cover, then contents, then sections)
+        starts, page_no = [], 2 + toc_pages
+        for _, pages in laid_out:
+            starts.append(page_no)
+            page_no += len(pages)
+        total_pages = page_no - 1
+
+        pdf = canvas.Canvas(output, pagesize=self.pagesize, pageCompression=1)
+        pdf.setTitle(book_title)
+        # Registering fonts in a fixed order gives them the same resource names in every export,
+        # which is what lets cached page streams be replayed verbatim
+        for font in BOOK_FONTS:
+            pdf.setFont(font, 10)
+
+        pdf.setFont("Helvetica-Bold", 28)
+        pdf.drawCentredString(page_width / 2, page_height / 2 + 40, _sanitize(book_title))
+        pdf.setFont("Helvetica", 13)
+        if subtitle:
+            pdf.drawCentredString(page_width / 2, page_height / 2, _sanitize(subtitle))
+        pdf.drawCentredString(page_width / 2, page_height / 2 - 24, time.strftime("%B %d, %Y"))
+        pdf.showPage()
+
+        for t in range(toc_pages):
+            pdf.setFont("Helvetica-Bold", 18)
+            pdf.drawString(MARGIN, page_height - MARGIN, "Contents")
+            y = page_height - MARGIN - 40
+            pdf.setFont(toc_font, toc_size)
+            for i in range(t * toc_per_page, min(len(laid_out), (t + 1) * toc_per_page)):
+                title = _sanitize(laid_out[i][0][0])
+                pdf.drawString(MARGIN, y, title[:90])
+                pdf.drawRightString(page_width - MARGIN, y, str(starts[i]))
+                pdf.linkAbsolute("", f"section-{i}", (MARGIN, y - 3, page_width - MARGIN, y + toc_size))
+                y -= toc_leading
+            self._footer(pdf, 2 + t, total_pages)
+            pdf.showPage()
+
+        for i, (key, pages) in enumerate(laid_out):
+            pdf.bookmarkPage(f"section-{i}")
+            pdf.addOutlineEntry(_sanitize(key[0]), f"section-{i}", level=0)
+            if key not in self._page_code:
+                self._page_code[key] = [self._page_stream(pdf, ops) for ops in pages]
+            for offset, code in enumerate(self._page_code[key]):
+                pdf.drawText(_CachedText(code))
+                self._footer(pdf, starts[i] + offset, total_pages, key[0] if offset else None)
+                pdf.showPage()
+
+        pdf.save()
+        return total_pages
+
+    @staticmethod
+    def _page_stream(pdf, ops):
+        """Encodes one page of draw ops as a single PDF text object and returns its operator string."""
+        text_object = pdf.beginText()
+        current = None
+        for font, size, x, y, text in ops:
+            if (font, size) != current:
+                text_object.setFont(font, size)
+                current = (font, size)
+            text_object.setTextOrigin(x, y)
+            text_object.textOut(text)
+        return text_object.getCode()
+
+    def _footer(self, pdf, page_no, total_pages, running_title=None):
+        page_width = self.pagesize[0]
+        pdf.setFont("Helvetica", 8)
+        pdf.drawRightString(page_width - MARGIN, MARGIN / 2, f"{page_no} / {total_pages}")
+        if running_title:
+            pdf.drawString(MARGIN, MARGIN / 2, _sanitize(running_title)[:80])
+
+
+class _CachedText:
+    """Stands in for a reportlab text object whose operator string was rendered by an earlier export."""
+
+    def __init__(self, code):
+        self.code = code
+
+    def getCode(self):
+        return self.code
@@ -0,0 +1,203 @@
+import os
+import time
+import sqlite3
+import threading
+from collections.abc import MutableMapping
+from response_cache import DEFAULT_CACHE_DIR
+
+
+class ProjectStore:
+    """Durable, versioned storage for everything a project produces (characters, scripts, plans).
+
+    Each save of a changed artifact becomes a new version, so earlier drafts stay recoverable.
+    Contents are only read when asked for; listing a project touches names and version numbers only.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(DEFAULT_CACHE_DIR, "projects.sqlite")
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS projects ("
+            "id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS artifacts ("
+            "project_id INTEGER NOT NULL, kind TEXT NOT NULL, name TEXT NOT NULL, version INTEGER NOT NULL, "
+            "content TEXT NOT NULL, created REAL NOT NULL, PRIMARY KEY (project_id, kind, name, version))"
+        )
+        self._db.commit()
+
+    def project_id(self, name):
+        """Returns the id of project `name`, creating it on first use."""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO projects (name, created, updated) VALUES (?, ?, ?)", (name, now, now)
+            )
+            self._db.commit()
+            return self._db.execute("SELECT id FROM projects WHERE name = ?", (name,)).fetchone()[0]
+
+    def projects(self):
+        """Project names, most recently updated first."""
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT name FROM projects ORDER BY updated DESC")]
+
+    def save_artifact(self, project_id, kind, name, content):
+        """Stores `content` as the next version of an artifact and returns its version number.
+
+        Saving content identical to the latest version is a no-op that returns that version.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT version, content FROM artifacts WHERE project_id = ? AND kind = ? AND name = ? "
+                "ORDER BY version DESC LIMIT 1",
+                (project_id, kind, name)
+            ).fetchone()
+            if row is not None and row[1] == content:
+                return row[0]
+            version = row[0] + 1 if row else 1
+            self._db.execute(
+                "INSERT INTO artifacts (project_id, kind, name, version, content, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (project_id, kind, name, version, content, now)
+            )
+            self._db.execute("UPDATE projects SET updated = ? WHERE id = ?", (now, project_id))
+            self._db.commit()
+            return version
+
+    def latest_versions(self, project_id, kind):
+        """Returns {name: latest_version} for a kind of artifact, in order of first creation."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT name, MAX(version) FROM artifacts WHERE project_id = ? AND kind = ? "
+                "GROUP BY name ORDER BY MIN(rowid)",
+                (project_id, kind)
+            ).fetchall()
+        return dict(rows)
+
+    def load_artifact(self, project_id, kind, name, version=None):
+        """Returns the content of one version of an artifact (the latest by default), or None."""
+        with self._lock:
+            if version is None:
+                row = self._db.execute(
+                    "SELECT content FROM artifacts WHERE project_id = ? AND kind = ? AND name = ? "
+                    "ORDER BY version DESC LIMIT 1",
+                    (project_id, kind, name)
+                ).fetchone()
+            else:
+                row = self._db.execute(
+                    "SELECT content FROM artifacts WHERE project_id = ? AND kind = ? AND name = ? AND version = ?",
+                    (project_id, kind, name, version)
+                ).fetchone()
+        return row[0] if row else None
+
+    def history(self, project_id, kind, name):
+        """Returns [(version, created_timestamp)] for an artifact, oldest first."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT version, created FROM artifacts WHERE project_id = ? AND kind = ? AND name = ? ORDER BY version",
+                (project_id, kind, name)
+            ).fetchall()
+
+    def delete_artifact(self, project_id, kind, name):
+        """Removes every version of an artifact."""
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM artifacts WHERE project_id = ? AND kind = ? AND name = ?", (project_id, kind, name)
+            )
+            self._db.commit()
+
+    def artifacts(self, project_id, kind):
+        """Returns a dict-like, write-through view of the latest version of each artifact of `kind`."""
+        return ArtifactMap(self, project_id, kind)
+
+
+class ArtifactMap(MutableMapping):
+    """Dict-like view of one kind of project artifact.
+
+    Names and versions are read up front; contents are loaded on first access and then kept.
+    Assignments are saved to the store immediately as new versions.
+    """
+
+    def __init__(self, store, project_id, kind):
+        self.store = store
+        self.project_id = project_id
+        self.kind = kind
+        self._versions = store.latest_versions(project_id, kind)
+        self._contents = {}
+
+    def __getitem__(self, name):
+        if name not in self._versions:
+            raise KeyError(name)
+        if name not in self._contents:
+            self._contents[name] = self.store.load_artifact(self.project_id, self.kind, name, self._versions[name])
+        return self._contents[name]
+
+    def __setitem__(self, name, content):
+        self._versions[name] = self.store.save_artifact(self.project_id, self.kind, name, content)
+        self._contents[name] = content
+
+    def __delitem__(self, name):
+        if name not in self._versions:
+            raise KeyError(name)
+        self.store.delete_artifact(self.project_id, self.kind, name)
+        del self._versions[name]
+        self._contents.pop(name, None)
+
+    def __iter__(self):
+        return iter(list(self._versions))
+
+    def __len__(self):
+        return len(self._versions)
+
+    def __contains__(self, name):
+        return name in self._versions
+
+    def version(self, name):
+        return self._versions[name]
+
+    def history(self, name):
+        return self.store.history(self.project_id, self.kind, name)
+
+
+class MasterBook:
+    """Master Production Book export that is rebuilt only where its source plans changed.
+
+    `plans` is an ArtifactMap (or any mapping; plain dicts are compared by content). Rendered sections
+    are kept per plan and version, so an unchanged book costs one version comparison per section,
+    and a newly appended plan renders just its own section.
+    """
+
+    HEADER = "# Master Production Book\n\n"
+
+    def __init__(self, plans):
+        self.plans = plans
+        self._sections = {}
+        self._order = []
+        self._text = None
+
+    def _stamp(self, name):
+        version = getattr(self.plans, "version", None)
+        return version(name) if version else self.plans[name]
+
+    def text(self):
+        names = list(self.plans)
+        edited = False
+        for name in names:
+            stamp = self._stamp(name)
+            cached = self._sections.get(name)
+            if cached is None or cached[0] != stamp:
+                edited = edited or cached is not None
+                self._sections[name] = (stamp, f"## {name}\n{self.plans[name]}\n\n---\n\n")
+
+        if self._text is not None and not edited and names[:len(self._order)] == self._order:
+            # Nothing changed, or plans were only appended: extend the text instead of re-joining it
+            if len(names) > len(self._order):
+                self._text += "".join(self._sections[name][1] for name in names[len(self._order):])
+        else:
+            self._text = self.HEADER + "".join(self._sections[name][1] for name in names)
+        self._order = names
+        return self._text
@@ -0,0 +1,212 @@
+import os
+import time
+import heapq
+import random
+import sqlite3
+import hashlib
+import itertools
+import threading
+
+# Lower values are dispatched first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+DEFAULT_REQUESTS_PER_MINUTE = int(os.getenv("GROQ_REQUESTS_PER_MINUTE", "30"))
+DEFAULT_TOKENS_PER_MINUTE = int(os.getenv("GROQ_TOKENS_PER_MINUTE", "12000"))
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+class TokenBucket:
+    """Continuously refilling budget of `per_minute` units that can burst up to one minute's worth."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` can be taken; oversized requests only need a full bucket."""
+        self._refill(now)
+        needed = min(amount, self.capacity) - self.tokens
+        return max(0.0, needed / self.rate)
+
+    def take(self, amount, now):
+        self._refill(now)
+        self.tokens -= amount
+
+    def adjust(self, delta):
+        """Credits (positive) or charges (negative) units once the true cost of a request is known."""
+        self.tokens = min(self.capacity, self.tokens + delta)
+
+
+class SharedTokenBucket:
+    """A TokenBucket whose balance lives in a SQLite row, so several processes draw on one budget.
+
+    Each read or change is one immediate transaction on wall-clock time. A check and the take that
+    follows are separate transactions, so two processes can briefly overdraw the bucket; the negative
+    balance is then waited out by whoever comes next, as with an oversized request.
+    """
+
+    def __init__(self, path, name, per_minute):
+        self.name = name
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+        self._db.execute("INSERT OR IGNORE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)", (name, self.capacity, time.time()))
+
+    def _update(self, change):
+        """Refills the shared balance, applies `change` to it and returns the result."""
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            tokens, updated = self._db.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (self.name,)).fetchone()
+            now = time.time()
+            tokens = change(min(self.capacity, tokens + max(0.0, now - updated) * self.rate))
+            self._db.execute("UPDATE buckets SET tokens = ?, updated = ? WHERE name = ?", (tokens, now, self.name))
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        return tokens
+
+    def wait_time(self, amount, now):
+        needed = min(amount, self.capacity) - self._update(lambda tokens: tokens)
+        return max(0.0, needed / self.rate)
+
+    def take(self, amount, now):
+        self._update(lambda tokens: tokens - amount)
+
+    def adjust(self, delta):
+        self._update(lambda tokens: min(self.capacity, tokens + delta))
+
+
+class RequestScheduler:
+    """Process-wide gate in front of the Groq client.
+
+    Requests wait in a priority queue until both the requests-per-minute and tokens-per-minute
+    buckets can cover them. Rate-limit and transient server errors are retried with jittered
+    exponential backoff, and a Retry-After from the server pauses every queued caller, not just
+    the one that was throttled.
+
+    With `quota_path`, both buckets are SharedTokenBucket rows named after `quota_name`, so every
+    process scheduling for the same key (the app and its job workers) shares one quota. Priorities
+    still order callers within a process; across processes, requests are served as quota frees up.
+    """
+
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE,
+                 max_retries=6, base_delay=1.0, max_delay=60.0, quota_path=None, quota_name="default"):
+        if quota_path:
+            self.request_bucket = SharedTokenBucket(quota_path, f"{quota_name}:requests", requests_per_minute)
+            self.token_bucket = SharedTokenBucket(quota_path, f"{quota_name}:tokens", tokens_per_minute)
+        else:
+            self.request_bucket = TokenBucket(requests_per_minute)
+            self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._condition = threading.Condition()
+        self.stats = {"dispatched": 0, "retries": 0, "rate_limited": 0, "wait_seconds": 0.0}
+
+    def submit(self, fn, estimated_tokens, priority=PRIORITY_INTERACTIVE):
+        """Runs `fn()` once quota allows, retrying throttled or transient failures.
+
+        Returns (result, queue_wait_seconds). The final exception is re-raised if every retry fails.
+        """
+        queue_wait = 0.0
+        for attempt in range(self.max_retries + 1):
+            queue_wait += self._acquire(priority, estimated_tokens)
+            try:
+                return fn(), queue_wait
+            except Exception as e:
+                retryable, retry_after = _classify_error(e)
+                if not retryable or attempt == self.max_retries:
+                    raise
+                backoff = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+                delay = max(retry_after or 0.0, backoff)
+                with self._condition:
+                    self.stats["retries"] += 1
+                    if retry_after is not None:
+                        self.stats["rate_limited"] += 1
+                        # Honour Retry-After for everyone queued behind this key
+                        self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                        self._condition.notify_all()
+                time.sleep(delay)
+                queue_wait += delay
+
+    def record_usage(self, estimated_tokens, actual_tokens):
+        """Settles the difference between the token estimate charged at dispatch and real usage."""
+        with self._condition:
+            self.token_bucket.adjust(estimated_tokens - actual_tokens)
+            self._condition.notify_all()
+
+    def _acquire(self, priority, tokens):
+        ticket = (priority, next(self._sequence))
+        started = time.monotonic()
+        with self._condition:
+            heapq.heappush(self._waiting, ticket)
+            while True:
+                now = time.monotonic()
+                if self._waiting[0] == ticket:
+                    wait = max(
+                        self._paused_until - now,
+                        self.request_bucket.wait_time(1, now),
+                        self.token_bucket.wait_time(tokens, now)
+                    )
+                    if wait <= 0:
+                        heapq.heappop(self._waiting)
+                        self.request_bucket.take(1, now)
+                        self.token_bucket.take(tokens, now)
+                        waited = now - started
+                        self.stats["dispatched"] += 1
+                        self.stats["wait_seconds"] += waited
+                        self._condition.notify_all()
+                        return waited
+                    self._condition.wait(timeout=wait)
+                else:
+                    # Someone with higher priority (or earlier arrival) goes first
+                    self._condition.wait()
+
+
+def _classify_error(error):
+    """Returns (retryable, retry_after_seconds) for an exception raised by the Groq client."""
+    status = getattr(error, "status_code", None)
+    response = getattr(error, "response", None)
+    if status is None and response is not None:
+        status = getattr(response, "status_code", None)
+
+    if status == 429:
+        headers = getattr(response, "headers", None) or {}
+        try:
+            return True, float(headers.get("retry-after"))
+        except (TypeError, ValueError):
+            return True, None
+    if status is not None:
+        return status >= 500, None
+    # Connection resets and timeouts carry no status code
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError", "ConnectionError", "TimeoutError"), None
+
+
+def get_scheduler(api_key, **limits):
+    """Returns the shared scheduler for an API key; quotas are enforced per key.
+
+    `limits` (RequestScheduler keyword arguments) only apply when the key's scheduler is first created.
+    A shared quota (`quota_path`) is named after a hash of the key, so the key itself is never stored.
+    """
+    with _schedulers_lock:
+        if api_key not in _schedulers:
+            if limits.get("quota_path"):
+                limits.setdefault("quota_name", hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16])
+            _schedulers[api_key] = RequestScheduler(**limits)
+        return _schedulers[api_key]
@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+DEFAULT_CACHE_DIR = os.getenv("SCRIPTORIA_CACHE_DIR", ".scriptoria_cache")
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+class ResponseCache:
+    """Two-tier cache for chat completions: an in-process LRU in front of an on-disk SQLite store.
+
+    Entries are content-addressed by a hash of the full request (model, messages and sampling
+    parameters), expire after `ttl_seconds` and are evicted least-recently-used past the size caps.
+    """
+
+    def __init__(self, path=None, max_memory_items=256, max_disk_items=5000, ttl_seconds=7 * 24 * 3600):
+        self.path = path or os.path.join(DEFAULT_CACHE_DIR, "responses.sqlite")
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self.ttl_seconds = ttl_seconds
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._db.commit()
+
+    @staticmethod
+    def make_key(request):
+        """Hashes a completion request dict into a stable cache key."""
+        payload = json.dumps(request, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created = entry
+                if now - created <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+            row = self._db.execute(
+                "SELECT value, created FROM responses WHERE key = ? AND created >= ?",
+                (key, now - self.ttl_seconds)
+            ).fetchone()
+            if row is None:
+                self._counters["misses"] += 1
+                return None
+
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self._remember(key, row[0], row[1])
+            self._counters["disk_hits"] += 1
+            return row[0]
+
+    def set(self, key, value):
+        # Failed calls are surfaced as "Error: ..." strings and must never be replayed
+        if not value or value.startswith("Error"):
+            return
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            self._db.commit()
+            self._counters["writes"] += 1
+            self._writes_since_prune += 1
+            if self._writes_since_prune >= 50:
+                self._prune(now)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_items"] = len(self._memory)
+            stats["disk_items"] = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def _remember(self, key, value, created):
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def _prune(self, now):
+        self._writes_since_prune = 0
+        expired = self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,)).rowcount
+        overflow = self._db.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_items,)
+        ).rowcount
+        self._db.commit()
+        self._counters["evictions"] += expired + overflow
+
+
+def get_shared_cache():
+    """Returns the process-wide default cache so every engine instance shares one LRU and connection."""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache()
+        return _shared_cache
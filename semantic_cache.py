@@ -0,0 +1,244 @@
+import os
+import re
+import time
+import zlib
+import sqlite3
+import threading
+import numpy as np
+from response_cache import DEFAULT_CACHE_DIR
+
+EMBEDDING_DIM = 1024
+# Minimum cosine similarity for reusing a near-duplicate, per engine task; other tasks are never matched.
+# Similarity alone cannot tell "moon base heist" from "moon base romance" (0.82) or "footsteps" from
+# "no footsteps" (0.93), so a match is also bounded by SEMANTIC_WORD_CHANGES
+SEMANTIC_THRESHOLDS = {
+    "sound_design": 0.9,
+    "sound_blueprint": 0.9,
+    "character_profile": 0.85,
+    "production_blueprint": 0.85
+}
+# Content words (see content_words) a reused prompt may add or drop, per task. Every word of a sound
+# description names something audible, so those must match exactly; an idea or character sketch may
+# gain or lose one descriptive word ("a weary old salvager"). Swapping a word counts as two changes
+SEMANTIC_WORD_CHANGES = {
+    "sound_design": 0,
+    "sound_blueprint": 0,
+    "character_profile": 1,
+    "production_blueprint": 1
+}
+# Near-duplicates checked per lookup, best first, before giving up
+SEMANTIC_CANDIDATES = 5
+# Feature weights: whole words carry the meaning, bigrams word order, trigrams typos and plurals
+WORD_WEIGHT, BIGRAM_WEIGHT, TRIGRAM_WEIGHT = 1.0, 0.5, 0.25
+
+_WORD = re.compile(r"[a-z0-9]+")
+# Filler that changes how an idea is phrased, not what it is
+_STOPWORDS = frozenset(
+    "a an the and or of in on at to for with by from into over under its it is are this that "
+    "some very short long film movie scene clip video story 10s".split()
+)
+# Adding or dropping one of these flips the meaning, so it is never an allowed change
+_NEGATIONS = frozenset("no not never none nor neither nothing without cannot".split())
+
+_shared_semantic_cache = None
+_shared_semantic_cache_lock = threading.Lock()
+
+
+def _bucket(feature, dim):
+    h = zlib.crc32(feature.encode("utf-8"))
+    # The low bits pick the column, the top bit the sign, so colliding features tend to cancel out
+    return h % dim, -1.0 if h & 0x80000000 else 1.0
+
+
+def _words(text):
+    """Lowercase words of a prompt without filler, plurals folded ("storms" -> "storm")."""
+    return [
+        w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w
+        for w in _WORD.findall(text.lower()) if w not in _STOPWORDS
+    ]
+
+
+def embed(text, dim=EMBEDDING_DIM):
+    """Hashing-vectorizer embedding of a prompt: a unit-length float32 vector, computed locally.
+
+    Hyphens, case, plurals and filler words are ignored, so "a moon base heist" and "Moon-base heists
+    short film" embed identically.
+    """
+    words = _words(text)
+    vector = np.zeros(dim, dtype=np.float32)
+    features = [(w, WORD_WEIGHT) for w in words]
+    features += [(f"{a} {b}", BIGRAM_WEIGHT) for a, b in zip(words, words[1:])]
+    for w in words:
+        padded = f"<{w}>"
+        features += [(f"#{padded[i:i + 3]}", TRIGRAM_WEIGHT) for i in range(len(padded) - 2)]
+    for feature, weight in features:
+        column, sign = _bucket(feature, dim)
+        vector[column] += sign * weight
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def content_words(text):
+    """The meaningful words of a prompt, plurals folded, as a set."""
+    return frozenset(_words(text))
+
+
+def word_changes(text, other):
+    """Content words in one prompt but not the other, or None when a negation is among them."""
+    changed = content_words(text) ^ content_words(other)
+    return None if changed & _NEGATIONS else changed
+
+
+class SemanticCache:
+    """Near-duplicate cache: reuses a completion whose prompt means nearly the same as an earlier one.
+
+    Entries are partitioned by task and an exact-match scope (model, system prompt and any inputs that
+    must not be fuzzy-matched, such as a character's name). All vectors live in one preallocated NumPy
+    matrix, so a lookup is a single matrix-vector product over the whole index. The closest entries
+    above the task's similarity threshold are then checked, best first, for a prompt within the task's
+    allowed word changes; their texts and contents are read from SQLite only then. Entries expire after
+    `ttl_seconds`; past `max_items` the least recently used one is evicted.
+    """
+
+    def __init__(self, path=None, dim=EMBEDDING_DIM, max_items=2000, ttl_seconds=7 * 24 * 3600, thresholds=None, word_changes=None):
+        self.path = path or os.path.join(DEFAULT_CACHE_DIR, "semantic.sqlite")
+        self.dim = dim
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self.thresholds = dict(SEMANTIC_THRESHOLDS if thresholds is None else thresholds)
+        self.word_changes = dict(SEMANTIC_WORD_CHANGES if word_changes is None else word_changes)
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS semantic_entries ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, task TEXT NOT NULL, scope TEXT NOT NULL, text TEXT NOT NULL, "
+            "value TEXT NOT NULL, vector BLOB NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("DELETE FROM semantic_entries WHERE created < ?", (time.time() - ttl_seconds,))
+        self._db.commit()
+
+        # Row i of the index describes entry ids[i]; only the first `size` rows are live
+        self._vectors = np.zeros((max_items, dim), dtype=np.float32)
+        self._ids = np.zeros(max_items, dtype=np.int64)
+        self._partitions = np.zeros(max_items, dtype=np.int64)
+        self._created = np.zeros(max_items, dtype=np.float64)
+        self._accessed = np.zeros(max_items, dtype=np.float64)
+        self.size = 0
+        rows = self._db.execute(
+            "SELECT id, task, scope, vector, created, accessed FROM semantic_entries ORDER BY accessed DESC LIMIT ?",
+            (max_items,)
+        ).fetchall()
+        for entry_id, task, scope, blob, created, accessed in rows:
+            vector = np.frombuffer(blob, dtype=np.float32)
+            if vector.shape[0] == dim:
+                self._append(entry_id, self._partition(task, scope), vector, created, accessed)
+
+    @staticmethod
+    def _partition(task, scope):
+        return zlib.crc32(f"{task}\x00{scope}".encode("utf-8"))
+
+    def _append(self, entry_id, partition, vector, created, accessed):
+        i = self.size
+        self._vectors[i] = vector
+        self._ids[i] = entry_id
+        self._partitions[i] = partition
+        self._created[i] = created
+        self._accessed[i] = accessed
+        self.size += 1
+
+    def _remove(self, i):
+        """Drops row i by moving the last live row into its place."""
+        last = self.size - 1
+        for array in (self._vectors, self._ids, self._partitions, self._created, self._accessed):
+            array[i] = array[last]
+        self.size -= 1
+
+    def _search(self, partition, vector, now, threshold=-1.0, limit=1):
+        """Returns [(row, similarity)] of up to `limit` live entries in a partition at or above
+        `threshold`, closest first."""
+        live = (self._partitions[:self.size] == partition) & (self._created[:self.size] >= now - self.ttl_seconds)
+        if not live.any():
+            return []
+        similarities = self._vectors[:self.size] @ vector
+        similarities[~live] = -np.inf
+        limit = min(limit, self.size)
+        rows = np.argpartition(-similarities, limit - 1)[:limit]
+        rows = rows[np.argsort(-similarities[rows])]
+        return [(int(row), float(similarities[row])) for row in rows if similarities[row] >= threshold]
+
+    def lookup(self, task, scope, text):
+        """Returns (value, similarity, matched_text) for the nearest earlier prompt above the task's
+        threshold and within its allowed word changes, or None."""
+        threshold = self.thresholds.get(task)
+        if threshold is None:
+            return None
+        vector = embed(text, self.dim)
+        allowed = self.word_changes.get(task, 0)
+        now = time.time()
+        with self._lock:
+            for row, similarity in self._search(self._partition(task, scope), vector, now, threshold, SEMANTIC_CANDIDATES):
+                entry_id = int(self._ids[row])
+                value, matched = self._db.execute(
+                    "SELECT value, text FROM semantic_entries WHERE id = ?", (entry_id,)
+                ).fetchone()
+                changed = word_changes(matched, text)
+                if changed is None or len(changed) > allowed:
+                    continue
+                self._accessed[row] = now
+                self._db.execute("UPDATE semantic_entries SET accessed = ? WHERE id = ?", (now, entry_id))
+                self._db.commit()
+                self._counters["hits"] += 1
+                return value, similarity, matched
+            self._counters["misses"] += 1
+        return None
+
+    def add(self, task, scope, text, value):
+        # Failed calls are surfaced as "Error: ..." strings and must never be replayed
+        if task not in self.thresholds or not value or value.startswith("Error"):
+            return
+        vector = embed(text, self.dim)
+        partition = self._partition(task, scope)
+        now = time.time()
+        with self._lock:
+            for row, _ in self._search(partition, vector, now, threshold=0.999):
+                # A regeneration of the same prompt replaces the earlier answer instead of shadowing it
+                self._db.execute("DELETE FROM semantic_entries WHERE id = ?", (int(self._ids[row]),))
+                self._remove(row)
+            if self.size == self.max_items:
+                victim = int(np.argmin(self._accessed[:self.size]))
+                self._db.execute("DELETE FROM semantic_entries WHERE id = ?", (int(self._ids[victim]),))
+                self._remove(victim)
+                self._counters["evictions"] += 1
+            cursor = self._db.execute(
+                "INSERT INTO semantic_entries (task, scope, text, value, vector, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (task, scope, text, value, vector.tobytes(), now, now)
+            )
+            self._db.commit()
+            self._append(cursor.lastrowid, partition, vector, now, now)
+            self._counters["writes"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM semantic_entries")
+            self._db.commit()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["items"] = self.size
+        return stats
+
+
+def get_shared_semantic_cache():
+    """Returns the process-wide semantic cache shared by every engine instance."""
+    global _shared_semantic_cache
+    with _shared_semantic_cache_lock:
+        if _shared_semantic_cache is None:
+            _shared_semantic_cache = SemanticCache()
+        return _shared_semantic_cache
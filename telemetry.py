@@ -0,0 +1,235 @@
+import os
+import json
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# JSONL call log and Prometheus scrape port; both are off unless configured
+TELEMETRY_LOG = os.getenv("SCRIPTORIA_TELEMETRY_LOG")
+METRICS_PORT = os.getenv("SCRIPTORIA_METRICS_PORT")
+
+# Upper bounds (seconds) of the Prometheus latency histogram buckets
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+# Workflow stage (app menu, CLI, benchmark case) that engine calls are attributed to
+_stage = contextvars.ContextVar("workflow_stage", default="unattributed")
+
+_shared_telemetry = None
+_shared_telemetry_lock = threading.Lock()
+
+
+def current_stage():
+    return _stage.get()
+
+
+def set_stage(name):
+    """Attributes every engine call made from the current context to `name`; returns a reset token."""
+    return _stage.set(name)
+
+
+@contextmanager
+def stage(name):
+    """Attributes engine calls made inside the block to workflow stage `name`."""
+    token = _stage.set(name)
+    try:
+        yield
+    finally:
+        _stage.reset(token)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted sequence; None when it is empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))]
+
+
+class RingBufferSink:
+    """Keeps the most recent call events in memory for the Performance panel."""
+
+    def __init__(self, max_events=500):
+        self._events = deque(maxlen=max_events)
+        self._lock = threading.Lock()
+
+    def emit(self, event):
+        with self._lock:
+            self._events.append(event)
+
+    def recent(self, limit=None):
+        """Returns events newest first."""
+        with self._lock:
+            events = list(self._events)
+        events.reverse()
+        return events[:limit] if limit else events
+
+    def summary(self):
+        """Rolling latency percentiles per task and token spend per workflow stage over the buffer."""
+        events = self.recent()
+        tasks = {}
+        for event in events:
+            tasks.setdefault(event["task"], []).append(event)
+        latency = {
+            task: {
+                "calls": len(calls),
+                # Where the task is currently routed (newest call first)
+                "model": calls[0]["model"],
+                "errors": sum(1 for e in calls if e["outcome"] == "error"),
+                "cache_hits": sum(1 for e in calls if e["cached"]),
+                "p50_s": percentile([e["wall_s"] for e in calls], 50),
+                "p95_s": percentile([e["wall_s"] for e in calls], 95),
+                "ttft_p50_s": percentile([e["ttft_s"] for e in calls if e["ttft_s"] is not None], 50),
+                "queue_p95_s": percentile([e["queue_wait_s"] for e in calls], 95)
+            }
+            for task, calls in tasks.items()
+        }
+        stages = {}
+        for event in events:
+            totals = stages.setdefault(event["stage"], {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+            totals["calls"] += 1
+            totals["prompt_tokens"] += event["prompt_tokens"]
+            totals["completion_tokens"] += event["completion_tokens"]
+        return {"tasks": latency, "stages": stages}
+
+
+class JsonlSink:
+    """Appends one JSON object per call to a log file."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def emit(self, event):
+        line = json.dumps(event, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+
+class PrometheusSink:
+    """Aggregates call events into counters and a latency histogram in Prometheus text format."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._calls = {}
+        self._tokens = {}
+        self._latency = {}
+        self._lock = threading.Lock()
+
+    def emit(self, event):
+        task = event["task"]
+        with self._lock:
+            key = (task, event["stage"], event["model"], event["outcome"])
+            self._calls[key] = self._calls.get(key, 0) + 1
+            for kind in ("prompt", "completion"):
+                key = (task, event["stage"], kind)
+                self._tokens[key] = self._tokens.get(key, 0) + event[f"{kind}_tokens"]
+            if not event["cached"]:
+                counts, total = self._latency.get(task, ([0] * (len(self.buckets) + 1), 0.0))
+                for i, bound in enumerate(self.buckets):
+                    if event["wall_s"] <= bound:
+                        counts[i] += 1
+                counts[-1] += 1
+                self._latency[task] = (counts, total + event["wall_s"])
+
+    def render(self):
+        with self._lock:
+            lines = [
+                "# HELP scriptoria_llm_calls_total Engine completion calls by routed model and outcome.",
+                "# TYPE scriptoria_llm_calls_total counter"
+            ]
+            for (task, stage_name, model, outcome), count in sorted(self._calls.items()):
+                lines.append(f'scriptoria_llm_calls_total{{task="{task}",stage="{_escape(stage_name)}",model="{model}",outcome="{outcome}"}} {count}')
+            lines += [
+                "# HELP scriptoria_llm_tokens_total Prompt and completion tokens reported by the API.",
+                "# TYPE scriptoria_llm_tokens_total counter"
+            ]
+            for (task, stage_name, kind), count in sorted(self._tokens.items()):
+                lines.append(f'scriptoria_llm_tokens_total{{task="{task}",stage="{_escape(stage_name)}",kind="{kind}"}} {count}')
+            lines += [
+                "# HELP scriptoria_llm_latency_seconds Wall time of uncached completion calls.",
+                "# TYPE scriptoria_llm_latency_seconds histogram"
+            ]
+            for task, (counts, total) in sorted(self._latency.items()):
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(f'scriptoria_llm_latency_seconds_bucket{{task="{task}",le="{bound}"}} {count}')
+                lines.append(f'scriptoria_llm_latency_seconds_bucket{{task="{task}",le="+Inf"}} {counts[-1]}')
+                lines.append(f'scriptoria_llm_latency_seconds_sum{{task="{task}"}} {total:.6f}')
+                lines.append(f'scriptoria_llm_latency_seconds_count{{task="{task}"}} {counts[-1]}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+class Telemetry:
+    """Fans per-call engine events out to pluggable sinks.
+
+    A sink is any object with an `emit(event)` method; events are plain dicts (see AIEngine._record).
+    The ring buffer and Prometheus aggregator are always attached so the app can read them back.
+    """
+
+    def __init__(self, ring_size=500, log_path=None):
+        self.ring = RingBufferSink(ring_size)
+        self.prometheus = PrometheusSink()
+        self.sinks = [self.ring, self.prometheus]
+        if log_path:
+            self.sinks.append(JsonlSink(log_path))
+        self._server = None
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def emit(self, event):
+        for sink in self.sinks:
+            try:
+                sink.emit(event)
+            except Exception as e:
+                # Instrumentation must never take a generation down with it
+                print(f"Telemetry sink {type(sink).__name__} failed: {e}")
+
+    def serve_metrics(self, port, host="127.0.0.1"):
+        """Exposes the Prometheus text format at http://host:port/metrics on a daemon thread."""
+        if self._server is not None:
+            return self._server
+        prometheus = self.prometheus
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = prometheus.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer((host, int(port)), MetricsHandler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server
+
+
+def get_telemetry():
+    """Returns the process-wide telemetry hub, configured from SCRIPTORIA_TELEMETRY_LOG / SCRIPTORIA_METRICS_PORT."""
+    global _shared_telemetry
+    with _shared_telemetry_lock:
+        if _shared_telemetry is None:
+            _shared_telemetry = Telemetry(log_path=TELEMETRY_LOG)
+            if METRICS_PORT:
+                try:
+                    _shared_telemetry.serve_metrics(METRICS_PORT)
+                except OSError as e:
+                    print(f"Metrics endpoint unavailable on port {METRICS_PORT}: {e}")
+        return _shared_telemetry